@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+
+def _split_filename(filename):
+    if filename.endswith('.npz'):
+        filename = filename[:-len('.npz')]
+    return ('%s.npz' % filename, '%s.coords' % filename)
+
+
+def _save_meta(filename, offsets, colors, stables):
+    stable_coords, stable_offsets = _pack([s[:2] for s in stables])
+    np.savez(filename, offsets=offsets,
+             colors=np.asarray(colors, dtype=str),
+             stable_coords=stable_coords, stable_offsets=stable_offsets,
+             stable_colors=np.asarray([s[2] for s in stables], dtype=str))
+
+
+def _pack(polylines):
+    coords = [np.asarray((np.ravel(xs), np.ravel(ys)), dtype=np.float32).T
+              for xs, ys in polylines]
+    offsets = np.zeros(len(coords) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(c) for c in coords])
+    if len(coords) == 0:
+        return np.zeros((0, 2), dtype=np.float32), offsets
+    return np.concatenate(coords), offsets
+
+
+class FrameStore(object):
+    def __init__(self, coords, offsets, n_objects, colors=None,
+                 stables=None):
+        self.coords = coords
+        self.offsets = offsets
+        self.n_objects = n_objects
+        self.colors = ['r'] * n_objects if colors is None else list(colors)
+        self.stables = list() if stables is None else stables
+
+    def __len__(self):
+        if self.n_objects == 0:
+            return 0
+        return (len(self.offsets) - 1) // self.n_objects
+
+    def get(self, frame, idx):
+        i = frame * self.n_objects + idx
+        coords = self.coords[self.offsets[i]:self.offsets[i + 1]]
+        return (coords[:, 0], coords[:, 1])
+
+    def save(self, filename):
+        metafile, coordfile = _split_filename(filename)
+        np.ascontiguousarray(self.coords, dtype=np.float32).tofile(coordfile)
+        _save_meta(metafile, self.offsets, self.colors, self.stables)
+
+    @staticmethod
+    def load(filename, mmap=True):
+        metafile, coordfile = _split_filename(filename)
+        data = np.load(metafile)
+        offsets = data['offsets']
+        if mmap and offsets[-1] > 0:
+            coords = np.memmap(coordfile, dtype=np.float32, mode='r',
+                               shape=(int(offsets[-1]), 2))
+        else:
+            coords = np.fromfile(coordfile, dtype=np.float32)
+            coords = coords.reshape(-1, 2)
+
+        colors = [str(c) for c in data['colors']]
+        stable_coords = data['stable_coords']
+        stable_offsets = data['stable_offsets']
+        stables = list()
+        for i, color in enumerate(data['stable_colors']):
+            c = stable_coords[stable_offsets[i]:stable_offsets[i + 1]]
+            stables.append((c[:, 0], c[:, 1], str(color)))
+        return FrameStore(coords, offsets, len(colors), colors, stables)
+
+
+def bake(drawer, frames, filename=None):
+    colors = [canvas.get_color() for _, canvas in drawer._obj]
+    stables = [(*line.get_data(), line.get_color())
+               for line in drawer._stable]
+
+    # objects may return views of buffers they reuse on the next step,
+    # so every frame is packed (copied) before stepping again
+    lengths = list()
+    if filename is None:
+        chunks = list()
+        for frame in range(frames):
+            coords, offsets = _pack(drawer.step())
+            chunks.append(coords)
+            lengths.extend(np.diff(offsets))
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths)
+        coords = np.concatenate(chunks) if len(chunks) > 0 else \
+            np.zeros((0, 2), dtype=np.float32)
+        return FrameStore(coords, offsets, len(drawer._obj), colors, stables)
+
+    metafile, coordfile = _split_filename(filename)
+    with open(coordfile, 'wb') as f:
+        for frame in range(frames):
+            coords, offsets = _pack(drawer.step())
+            coords.tofile(f)
+            lengths.extend(np.diff(offsets))
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(lengths)
+    _save_meta(metafile, offsets, colors, stables)
+    return FrameStore.load(filename)
+
+
+class BakedObject(object):
+    def __init__(self, store, idx):
+        self._store = store
+        self._idx = idx
+        self._frame = 0
+
+    def seek(self, frame):
+        self._frame = frame
+
+    def __call__(self, dt):
+        frame = min(self._frame, len(self._store) - 1)
+        self._frame += 1
+        return self._store.get(frame, self._idx)
+
+
+def replay(store, drawer, start=0):
+    for xs, ys, color in store.stables:
+        drawer.draw_stable_object(xs, ys, color=color)
+    objects = list()
+    for idx, color in enumerate(store.colors):
+        obj = BakedObject(store, idx)
+        obj.seek(start)
+        drawer.add_object(obj, color=color)
+        objects.append(obj)
+    return objects
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import tracemalloc
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from drawer import BaseDrawer, OfflineMP4Drawer
+from region import Region
+from move import StandardMove, AttenuateMove
+from objects import Ball, Trace, ParticleSystem
+from precision import get_dtype, set_dtype
+from trace import fold_into_range
+
+
+def build_scene(**kwargs):
+    drawer = OfflineMP4Drawer(xlim=[-1.0, 1.0], ylim=[-1.0, 1.0], **kwargs)
+    apexes = [[-0.8, -0.8], [-0.8, 0.8], [0.8, 0.8], [0.8, -0.8]]
+    region = Region(apexes)
+    move = StandardMove([0.5, 0.5], [-0.5, 0], [0, -0.3])
+    ball = Ball(move, region, 0.1)
+
+    drawer.add_object(ball)
+    drawer.add_object(Trace(ball), color='b')
+    drawer.draw_stable_object(*zip(*apexes, apexes[0]), color='k')
+    return drawer
+
+
+def bench_blit(frames=500):
+    for blit in (False, True):
+        drawer = build_scene(blit=blit)
+        canvas = FigureCanvasAgg(drawer.fig)
+        drawer._render(canvas)
+        start = time.perf_counter()
+        for frame in range(frames):
+            BaseDrawer.update(drawer, frame)
+            drawer._render(canvas)
+        elapsed = time.perf_counter() - start
+        print('blit=%-5s %8.1f frames/sec' % (blit, frames / elapsed))
+
+
+def _fold_loop(xs, lim):
+    xs = xs.copy()
+    n_reflect = 0
+    for i in range(len(xs)):
+        if xs[i] < lim[0]:
+            xs[i:] = lim[0] * 2 - xs[i:]
+            n_reflect += 1
+        elif xs[i] > lim[1]:
+            xs[i:] = lim[1] * 2 - xs[i:]
+            n_reflect += 1
+    return (xs, n_reflect)
+
+
+def bench_parabola(repeat=5):
+    lim = np.asarray([0.0, 1.0], dtype=np.float32)
+    for n in (1000, 10000, 50000):
+        xs = np.asarray(range(1, n), dtype=np.float32) * 0.05 * 3.0 + 0.5
+        for name, fold in (('loop', _fold_loop), ('fold', fold_into_range)):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                _, n_reflect = fold(xs, lim)
+            elapsed = (time.perf_counter() - start) / repeat
+            print('%5d samples %5d bounces %-4s %10.3f ms' %
+                  (n, n_reflect, name, elapsed * 1000))
+
+
+def _build_physics(n_balls=8, n_particles=256):
+    region = Region([[-0.8, -0.8], [-0.8, 0.8], [0.8, 0.8], [0.8, -0.8]])
+    rng = np.random.default_rng(0)
+    objects = [Ball(AttenuateMove(c, v, [0, -0.3], 0.9), region, 0.05)
+               for c, v in zip(rng.uniform(-0.6, 0.6, (n_balls, 2)),
+                               rng.uniform(-0.5, 0.5, (n_balls, 2)))]
+    objects.append(ParticleSystem(
+        region, rng.uniform(-0.6, 0.6, (n_particles, 2)),
+        rng.uniform(-0.5, 0.5, (n_particles, 2)), [0, -0.3], r=0.01))
+    return objects
+
+
+def bench_precision(frames=200, dt=0.02):
+    default = get_dtype()
+    for dtype in (np.float32, np.float64):
+        set_dtype(dtype)
+        objects = _build_physics()
+        for obj in objects:
+            obj(dt)
+
+        # every frame's output is kept alive, so the snapshot diff counts
+        # the blocks each step allocates for what it returns; temporaries
+        # freed within the step only show up in the peak
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__),
+                  tracemalloc.Filter(False, __file__)]
+        tracemalloc.start()
+        kept, peak = list(), 0
+        before = tracemalloc.take_snapshot().filter_traces(ignore)
+        start = time.perf_counter()
+        for frame in range(frames):
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            kept.append([obj(dt) for obj in objects])
+            peak += tracemalloc.get_traced_memory()[1] - current
+        elapsed = time.perf_counter() - start
+        after = tracemalloc.take_snapshot().filter_traces(ignore)
+        tracemalloc.stop()
+        stats = after.compare_to(before, 'filename')
+        allocs = sum(stat.count_diff for stat in stats)
+        size = sum(stat.size_diff for stat in stats)
+        print('%-7s %8.3f ms/frame %8.1f KiB peak/frame '
+              '%7.1f allocs/frame %8.1f KiB allocated/frame' %
+              (np.dtype(dtype).name, elapsed / frames * 1000,
+               peak / frames / 1024, allocs / frames,
+               size / frames / 1024))
+    set_dtype(default)
+
+
+BENCHMARKS = {
+    'blit': bench_blit,
+    'parabola': bench_parabola,
+    'precision': bench_precision,
+}
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] if len(sys.argv) > 1 else BENCHMARKS.keys()
+    for name in names:
+        print('[%s]' % name)
+        BENCHMARKS[name]()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import runpy
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+
+import drawer
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+REFERENCE = os.path.join(ROOT, 'reference')
+SCENES = ['scene%02d' % i for i in range(1, 9)] + ['example1', 'example2']
+
+
+def _summarize(xs, ys):
+    '''
+        one row per object and frame:
+        (points, mean x, mean y, min x, max x, min y, max y)
+    '''
+    xs = np.ravel(np.asarray(xs, dtype=np.float64))
+    ys = np.ravel(np.asarray(ys, dtype=np.float64))
+    finite = np.isfinite(xs) & np.isfinite(ys)
+    if not np.any(finite):
+        return [len(xs)] + [np.nan] * 6
+    xs, ys = xs[finite], ys[finite]
+    return [len(finite), xs.mean(), ys.mean(), xs.min(), xs.max(),
+            ys.min(), ys.max()]
+
+
+def record(scene):
+    records = list()
+
+    def start(self, frames=1000, interval=20, **kwargs):
+        for frame in range(frames):
+            records.append([_summarize(*obj(self.dt))
+                            for obj, _ in self._obj])
+
+    classes = [c for c in vars(drawer).values()
+               if isinstance(c, type) and issubclass(c, drawer.BaseDrawer)]
+    saved = [(c, c.__dict__['start']) for c in classes
+             if 'start' in c.__dict__]
+    for c, _ in saved:
+        c.start = start
+    try:
+        runpy.run_path(os.path.join(ROOT, '%s.py' % scene),
+                       run_name='__main__')
+    finally:
+        for c, method in saved:
+            c.start = method
+    return np.asarray(records, dtype=np.float64)
+
+
+def compare(scene, records, atol=1e-4):
+    expected = np.load(os.path.join(REFERENCE, '%s.npy' % scene))
+    if expected.shape != records.shape:
+        print('%-8s shape %s != reference %s' %
+              (scene, records.shape, expected.shape))
+        return False
+    close = np.isclose(records, expected, rtol=0.0, atol=atol,
+                       equal_nan=True)
+    diff = np.nanmax(np.abs(records - expected)) if records.size else 0.0
+    if np.all(close):
+        print('%-8s %5d frames  ok      max diff %.2e' %
+              (scene, len(records), diff))
+        return True
+    frame = np.flatnonzero(~np.all(close.reshape(len(close), -1), axis=1))[0]
+    print('%-8s %5d frames  FAILED  max diff %.2e from frame %d' %
+          (scene, len(records), diff, frame))
+    return False
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    update = '--update' in args
+    scenes = [a for a in args if a != '--update'] or SCENES
+
+    ok = True
+    for scene in scenes:
+        records = record(scene)
+        if update:
+            os.makedirs(REFERENCE, exist_ok=True)
+            np.save(os.path.join(REFERENCE, '%s.npy' % scene), records)
+            print('%-8s %5d frames  saved' % (scene, len(records)))
+        else:
+            ok = compare(scene, records) and ok
+    sys.exit(0 if ok else 1)
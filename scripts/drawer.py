@@ -1,12 +1,21 @@
 # -*- coding: utf-8 -*-
 
+import os
+import shutil
+import subprocess
+import tempfile
+import multiprocessing
+import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from bake import bake
 
 
 class BaseDrawer(object):
     def __init__(self, filename='output', xlim=[-1, 1],
-                 ylim=[-1, 1], dt=0.02):
+                 ylim=[-1, 1], dt=0.02, blit=False, sim_dt=None):
         self.fig = plt.figure()
         self._ax = self.fig.add_subplot(111)
         self._ax.set_xlim(*xlim)
@@ -17,20 +26,46 @@ class BaseDrawer(object):
         for k in ('left', 'right', 'top', 'bottom'):
             self._ax.spines[k].set_visible(False)
         self._obj = list()
+        self._stable = list()
+        self._hooks = list()
         self.dt = dt
         self.filename = filename
+        self.blit = blit
+        self._background = None
+        self.sim_dt = sim_dt
+        self._accumulator = 0.0
+        self._outputs = None
 
     def add_object(self, obj, color='r'):
-        canvas, = self._ax.plot([], [], color=color)
+        canvas, = self._ax.plot([], [], color=color, animated=self.blit)
         self._obj.append((obj, canvas))
 
     def draw_stable_object(self, xs, ys, color='r'):
-        self._ax.plot(xs, ys, color=color)
+        line, = self._ax.plot(xs, ys, color=color)
+        self._stable.append(line)
+
+    def add_hook(self, hook):
+        self._hooks.append(hook)
+
+    def _step_objects(self, dt):
+        for hook in self._hooks:
+            hook(dt)
+        return [obj(dt) for obj, _ in self._obj]
+
+    def step(self):
+        if self.sim_dt is None:
+            return self._step_objects(self.dt)
+
+        self._accumulator += self.dt
+        eps = self.sim_dt * 1e-6
+        while self._accumulator >= self.sim_dt - eps or self._outputs is None:
+            self._outputs = self._step_objects(self.sim_dt)
+            self._accumulator -= self.sim_dt
+        return self._outputs
 
     def update(self, frame):
         layers = list()
-        for obj, canvas in self._obj:
-            xs, ys = obj(self.dt)
+        for (_, canvas), (xs, ys) in zip(self._obj, self.step()):
             canvas.set_data(xs, ys)
             layers.append(canvas)
 
@@ -39,7 +74,8 @@ class BaseDrawer(object):
     def start(self, frames=1000, interval=20):
         self._frames = frames
         self.animation = FuncAnimation(self.fig, self.update,
-                                       frames=frames, interval=interval)
+                                       frames=frames, interval=interval,
+                                       blit=self.blit)
 
 
 class WindowDrawer(BaseDrawer):
@@ -50,11 +86,104 @@ class WindowDrawer(BaseDrawer):
 
 class MP4Drawer(BaseDrawer):
     def update(self, frame):
-        super().update(frame)
-        print(frame)
-        if frame % (self._frames // 100) == 0:
+        layers = super().update(frame)
+        if frame % max(self._frames // 100, 1) == 0:
             print('%6d / %6d frames' % (frame, self._frames))
+        return layers
 
     def start(self, **kwargs):
         super().start(**kwargs)
         self.animation.save('%s.mp4' % self.filename, writer='ffmpeg')
+
+
+class OfflineMP4Drawer(MP4Drawer):
+    def _open_ffmpeg(self, filename, width, height, fps):
+        cmd = ['ffmpeg', '-y', '-loglevel', 'error',
+               '-f', 'rawvideo', '-pix_fmt', 'rgba',
+               '-s', '%dx%d' % (width, height), '-r', '%g' % fps,
+               '-i', '-', '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+               '-vcodec', 'libx264', '-pix_fmt', 'yuv420p', filename]
+        return subprocess.Popen(cmd, stdin=subprocess.PIPE)
+
+    def _render(self, canvas):
+        if not self.blit:
+            canvas.draw()
+            return canvas.buffer_rgba()
+
+        if self._background is None:
+            canvas.draw()
+            self._background = canvas.copy_from_bbox(self.fig.bbox)
+        canvas.restore_region(self._background)
+        for _, artist in self._obj:
+            self._ax.draw_artist(artist)
+        return canvas.buffer_rgba()
+
+    def _encode(self, filename, frames, fps, update=None):
+        update = self.update if update is None else update
+        canvas = FigureCanvasAgg(self.fig)
+        height, width, _ = np.asarray(self._render(canvas)).shape
+        proc = self._open_ffmpeg(filename, width, height, fps)
+        for frame in frames:
+            update(frame)
+            proc.stdin.write(self._render(canvas))
+        proc.stdin.close()
+        if proc.wait() != 0:
+            raise RuntimeError('ffmpeg exited with status %d' %
+                               proc.returncode)
+
+    def start(self, frames=1000, interval=20):
+        self._frames = frames
+        self._encode('%s.mp4' % self.filename, range(frames),
+                     1000.0 / interval)
+
+
+_parallel_drawer = None
+
+
+def _encode_chunk(args):
+    filename, start, stop, fps = args
+    drawer = _parallel_drawer
+    drawer._encode(filename, range(start, stop), fps,
+                   update=drawer._set_frame)
+    return filename
+
+
+class ParallelMP4Drawer(OfflineMP4Drawer):
+    def _set_frame(self, frame):
+        for idx, (_, canvas) in enumerate(self._obj):
+            canvas.set_data(*self._store.get(frame, idx))
+
+    def _concat(self, segments, filename):
+        listfile = '%s.txt' % segments[0]
+        with open(listfile, 'w') as f:
+            for segment in segments:
+                f.write("file '%s'\n" % os.path.abspath(segment))
+        cmd = ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'concat',
+               '-safe', '0', '-i', listfile, '-c', 'copy', filename]
+        subprocess.check_call(cmd)
+
+    def start(self, frames=1000, interval=20, processes=None):
+        global _parallel_drawer
+
+        if frames < 1:
+            raise ValueError('frames must be positive: %d' % frames)
+        self._frames = frames
+        self._store = bake(self, frames)
+
+        processes = processes or os.cpu_count() or 1
+        bounds = np.linspace(0, frames, min(processes, frames) + 1)
+        bounds = bounds.astype(np.int64)
+        tmpdir = tempfile.mkdtemp()
+        chunks = [(os.path.join(tmpdir, 'segment%04d.mp4' % i),
+                   bounds[i], bounds[i + 1], 1000.0 / interval)
+                  for i in range(len(bounds) - 1)]
+
+        _parallel_drawer = self
+        try:
+            ctx = multiprocessing.get_context('fork')
+            with ctx.Pool(processes) as pool:
+                segments = pool.map(_encode_chunk, chunks)
+            self._concat(segments, '%s.mp4' % self.filename)
+        finally:
+            _parallel_drawer = None
+            shutil.rmtree(tmpdir)
@@ -1,21 +1,61 @@
 # -*- coding: utf-8 -*-
 
 from abc import ABCMeta, abstractmethod
+from bisect import bisect_right
 import numpy as np
 
+from precision import get_dtype
 from trigger import NullTrigger
 
 
+def euler(coord, velocity, accel, dt):
+    a = accel(coord, velocity)
+    return (coord + velocity * dt, velocity + a * dt)
+
+
+def semi_implicit_euler(coord, velocity, accel, dt):
+    velocity = velocity + accel(coord, velocity) * dt
+    return (coord + velocity * dt, velocity)
+
+
+def verlet(coord, velocity, accel, dt):
+    a1 = accel(coord, velocity)
+    coord = coord + velocity * dt + 0.5 * a1 * dt * dt
+    a2 = accel(coord, velocity + a1 * dt)
+    return (coord, velocity + 0.5 * (a1 + a2) * dt)
+
+
+def rk4(coord, velocity, accel, dt):
+    k1x, k1v = velocity, accel(coord, velocity)
+    k2x = velocity + k1v * (0.5 * dt)
+    k2v = accel(coord + k1x * (0.5 * dt), k2x)
+    k3x = velocity + k2v * (0.5 * dt)
+    k3v = accel(coord + k2x * (0.5 * dt), k3x)
+    k4x = velocity + k3v * dt
+    k4v = accel(coord + k3x * dt, k4x)
+    coord = coord + (k1x + 2 * k2x + 2 * k3x + k4x) * (dt / 6)
+    velocity = velocity + (k1v + 2 * k2v + 2 * k3v + k4v) * (dt / 6)
+    return (coord, velocity)
+
+
+INTEGRATORS = {
+    'euler': euler,
+    'semi_implicit_euler': semi_implicit_euler,
+    'verlet': verlet,
+    'rk4': rk4,
+}
+
+
 class Move(object):
     def __init__(self, coord=[0, 0]):
-        self._coord = np.asarray(coord, dtype=np.float32)
+        self._coord = np.asarray(coord, dtype=get_dtype())
 
     @abstractmethod
     def __call__(self, dt):
         raise NotImplementedError
 
     def set_coord(self, coord):
-        self._coord = np.asarray(coord, dtype=np.float32)
+        self._coord = np.asarray(coord, dtype=get_dtype())
 
     def get_coord(self):
         return self._coord.copy()
@@ -30,48 +70,65 @@ class StableMove(Move):
 
 
 class StandardMove(Move):
-    def __init__(self, coord, velocity=[0, 0], accel=[0, 0]):
+    def __init__(self, coord, velocity=[0, 0], accel=[0, 0],
+                 integrator='euler'):
         super().__init__(coord)
-        self._velocity = np.asarray(velocity, dtype=np.float32)
-        self._accel = np.asarray(accel, dtype=np.float32)
+        self._velocity = np.asarray(velocity, dtype=get_dtype())
+        self._accel = np.asarray(accel, dtype=get_dtype())
+        self.set_integrator(integrator)
+
+    def set_integrator(self, integrator):
+        self._integrator_name = integrator
+        if isinstance(integrator, str):
+            integrator = INTEGRATORS[integrator]
+        self._integrator = integrator
+
+    def _get_accel(self, coord, velocity):
+        return self._accel
 
     def __call__(self, dt):
-        self._coord = self._coord + self._velocity * dt
-        self._velocity = self._velocity + self._accel * dt
+        self._coord, self._velocity = self._integrator(
+            self._coord, self._velocity, self._get_accel, dt)
         return self._coord.copy()
 
     def set_velocity(self, velocity):
-        self._velocity = np.asarray(velocity, dtype=np.float32)
+        self._velocity = np.asarray(velocity, dtype=get_dtype())
 
     def get_velocity(self):
         return self._velocity.copy()
 
     def set_accel(self, accel):
-        self._accel = np.asarray(accel, dtype=np.float32)
+        self._accel = np.asarray(accel, dtype=get_dtype())
 
     def get_accel(self):
         return self._accel.copy()
 
     def copy(self):
         return StandardMove(self._coord.copy(), self._velocity.copy(),
-                            self._accel.copy())
+                            self._accel.copy(), self._integrator_name)
 
 
 class AttenuateMove(StandardMove):
     def __init__(self, coord, velocity=[0, 0], accel=[0, 0],
-                 elasticity=1.0, gamma=0.01):
-        super().__init__(coord, velocity, accel)
+                 elasticity=1.0, gamma=0.01, integrator='euler'):
+        super().__init__(coord, velocity, accel, integrator)
         self._elasticity = elasticity
         self._gamma = gamma
 
+    def _get_accel(self, coord, velocity):
+        return self._accel - self._gamma * velocity
+
     def __call__(self, dt):
+        if self._integrator is not euler:
+            return super().__call__(dt)
+        # the original damped update; v + (a - gamma v) dt rounds differently
         amp = (1 - self._gamma * dt)
         self._coord = self._coord + self._velocity * dt
         self._velocity = self._velocity * amp + self._accel * dt
         return self._coord.copy()
 
     def set_velocity(self, velocity, use_elasticity=True):
-        velocity = np.asarray(velocity, dtype=np.float32)
+        velocity = np.asarray(velocity, dtype=get_dtype())
         if use_elasticity:
             super().set_velocity(velocity * self._elasticity)
         else:
@@ -79,13 +136,174 @@ class AttenuateMove(StandardMove):
 
     def copy(self):
         return AttenuateMove(self._coord.copy(), self._velocity.copy(),
-                             self._accel.copy(), self._elasticity, self._gamma)
+                             self._accel.copy(), self._elasticity, self._gamma,
+                             self._integrator_name)
+
+
+def _get_exit_time(s0, sv, sa, lo, hi):
+    '''
+        first t > 0 at which s0 + sv t + sa t^2 / 2 leaves [lo, hi]
+    '''
+    times = [np.inf]
+    for bound in (lo, hi):
+        qa, qb, qc = 0.5 * sa, sv, s0 - bound
+        if qa == 0:
+            roots = [-qc / qb] if qb != 0 else []
+        elif qb * qb - 4 * qa * qc >= 0:
+            disc = np.sqrt(qb * qb - 4 * qa * qc)
+            roots = [(-qb - disc) / (2 * qa), (-qb + disc) / (2 * qa)]
+        else:
+            roots = []
+        times.extend(t for t in roots if t > 0)
+    return min(times)
+
+
+class AnalyticMove(StandardMove):
+    def __init__(self, coord, velocity=[0, 0], accel=[0, 0], region=None,
+                 r=0.0, elasticity=1.0, min_interval=1e-3):
+        super().__init__(coord, velocity, accel)
+        self._region = region
+        self.r = r
+        self._elasticity = elasticity
+        self.min_interval = min_interval
+        self.time = 0.0
+        self._free_accel = np.asarray(accel, dtype=np.float64)
+        self._starts = [0.0]
+        self._bounces = [False]
+        self._slides = [None]
+        self._segments = [(np.asarray(coord, dtype=np.float64),
+                           np.asarray(velocity, dtype=np.float64),
+                           self._free_accel)]
+        self._end = None
+
+    @staticmethod
+    def _evaluate(segment, t):
+        c, v, a = segment
+        return (c + v * t + 0.5 * a * t * t, v + a * t)
+
+    def _append(self, t, segment, bounce, slide=None):
+        self._starts.append(self._starts[-1] + t)
+        self._segments.append(segment)
+        self._bounces.append(bounce)
+        self._slides.append(slide)
+        return self._starts[-1]
+
+    def _get_slide_exit(self, segment, idx):
+        '''
+            time until the contact point of a sliding segment passes an
+            end of the edge it slides on
+        '''
+        apexes = self._region.apexes
+        p = np.asarray(apexes[idx], dtype=np.float64)
+        q = np.asarray(apexes[(idx + 1) % len(apexes)], dtype=np.float64)
+        tangent = (q - p) / np.sqrt((q - p) @ (q - p))
+        c, v, a = segment
+        lo, hi = sorted((p @ tangent, q @ tangent))
+        return _get_exit_time(c @ tangent, v @ tangent, a @ tangent, lo, hi)
+
+    def _next_segment(self):
+        segment, slide = self._segments[-1], self._slides[-1]
+        if self._region is None or len(self._region.lines) == 0:
+            return np.inf
+        c, v, a = segment
+        times = self._region.get_parabola_impacts(c, v, a, self.r)
+        if slide is not None:
+            times[slide] = np.inf
+        idx = int(np.argmin(times))
+        t = times[idx]
+
+        if slide is not None:
+            t_exit = self._get_slide_exit(segment, slide)
+            if t_exit < t:
+                coord, velocity = self._evaluate(segment, t_exit)
+                return self._append(t_exit, (coord, velocity,
+                                             self._free_accel), False)
+        if np.isinf(t):
+            return np.inf
+
+        # a bounce whose flight would be shorter than min_interval drops
+        # the normal motion instead, and the body slides along the edge
+        coord, velocity = self._evaluate(segment, t)
+        line = self._region.lines[idx]
+        n = line._n.astype(np.float64)
+        n = n if n @ coord + line._b >= 0 else -n
+        vn, an = velocity @ n, self._free_accel @ n
+        if -2 * vn <= max(-an, 0.0) * self.min_interval:
+            velocity = velocity - vn * n
+            accel = self._free_accel - min(an, 0.0) * n
+            return self._append(t, (coord, velocity, accel), True, idx)
+
+        velocity = line.get_reflect_vector(velocity) * self._elasticity
+        return self._append(t, (coord, np.asarray(velocity, dtype=np.float64),
+                                self._free_accel), True)
+
+    def _extend(self, time):
+        while self._end is None or self._end <= time:
+            self._end = self._next_segment()
+
+    def get_bounce_times(self, time):
+        self._extend(time)
+        return [t for t, bounce in zip(self._starts, self._bounces)
+                if bounce and t <= time]
+
+    def get_state_at(self, time):
+        self._extend(time)
+        idx = bisect_right(self._starts, time) - 1
+        return self._evaluate(self._segments[idx], time - self._starts[idx])
+
+    def _restart(self, coord=None, velocity=None):
+        c, v = self.get_state_at(self.time)
+        segment = tuple(np.asarray(x if y is None else y, dtype=np.float64)
+                        for x, y in ((c, coord), (v, velocity),
+                                     (self._free_accel, None)))
+
+        idx = bisect_right(self._starts, self.time)
+        del self._starts[idx:], self._segments[idx:]
+        del self._bounces[idx:], self._slides[idx:]
+        if self._starts[-1] == self.time:
+            self._segments[-1] = segment
+            self._slides[-1] = None
+        else:
+            self._append(self.time - self._starts[-1], segment, False)
+        self._end = None
+
+    def set_coord(self, coord):
+        super().set_coord(coord)
+        self._restart(coord=coord)
+
+    def set_velocity(self, velocity):
+        super().set_velocity(velocity)
+        self._restart(velocity=velocity)
+
+    def set_accel(self, accel):
+        super().set_accel(accel)
+        self._free_accel = np.asarray(accel, dtype=np.float64)
+        self._restart()
+
+    def get_coord_at(self, time):
+        return self.get_state_at(time)[0].astype(get_dtype())
+
+    def seek(self, time):
+        self.time = time
+        coord, velocity = self.get_state_at(time)
+        self._coord = coord.astype(get_dtype())
+        self._velocity = velocity.astype(get_dtype())
+        return self._coord.copy()
+
+    def __call__(self, dt):
+        return self.seek(self.time + dt)
+
+    def copy(self):
+        return AnalyticMove(self._coord.copy(), self._velocity.copy(),
+                            self._accel.copy(), self._region, self.r,
+                            self._elasticity, self.min_interval)
 
 
 class TriggeredMove(AttenuateMove):
     def __init__(self, coord, velocity=[0, 0], accel=[0, 0],
-                 elasticity=1.0, gamma=0):
-        super().__init__(coord, velocity, accel, elasticity, gamma)
+                 elasticity=1.0, gamma=0, integrator='euler'):
+        super().__init__(coord, velocity, accel, elasticity, gamma,
+                         integrator)
         self._start_trigger = NullTrigger(state=True)
         self._end_trigger = NullTrigger(state=False)
         self._action = list()
@@ -108,7 +326,8 @@ class TriggeredMove(AttenuateMove):
 
     def copy(self):
         move = TriggeredMove(self._coord, self._velocity, self._accel,
-                             self._elasticity, self._gamma)
+                             self._elasticity, self._gamma,
+                             self._integrator_name)
         move.set_trigger(self._start_trigger, self._end_trigger)
         return move
 
@@ -4,6 +4,81 @@ import math
 from abc import ABCMeta, abstractmethod
 import numpy as np
 
+from precision import get_dtype
+
+
+def sweep_and_prune(coords, r):
+    coords = np.asarray(coords, dtype=get_dtype()).reshape(-1, 2)
+    r = np.broadcast_to(np.asarray(r, dtype=get_dtype()), len(coords))
+    order = np.argsort(coords[:, 0] - r, kind='stable')
+    lo = (coords[:, 0] - r)[order]
+    hi = (coords[:, 0] + r)[order]
+    end = np.searchsorted(lo, hi, side='right')
+    counts = np.maximum(end - np.arange(len(lo)) - 1, 0)
+    i = np.repeat(np.arange(len(lo)), counts)
+    j = i + 1 + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) -
+                                                    counts, counts)
+    i, j = order[i], order[j]
+
+    d = coords[j] - coords[i]
+    hit = np.sum(d * d, axis=1) <= (r[i] + r[j]) ** 2
+    return (i[hit], j[hit])
+
+
+def _resolve_pairs(coords, velocity, m, r, i, j):
+    d = coords[j] - coords[i]
+    dist = np.sqrt(np.sum(d * d, axis=1))
+    n = d / np.where(dist > 0, dist, 1)[:, np.newaxis]
+    vrel = np.sum((velocity[i] - velocity[j]) * n, axis=1)
+    approach = vrel > 0
+    i, j, n, vrel, dist = i[approach], j[approach], n[approach], \
+        vrel[approach], dist[approach]
+
+    mt = (m[i] + m[j])[:, np.newaxis]
+    impulse = (2 * vrel)[:, np.newaxis] * n / mt
+    overlap = np.maximum(r[i] + r[j] - dist, 0)[:, np.newaxis] * n / mt
+    velocity[i] -= impulse * m[j, np.newaxis]
+    velocity[j] += impulse * m[i, np.newaxis]
+    coords[i] -= overlap * m[j, np.newaxis]
+    coords[j] += overlap * m[i, np.newaxis]
+    return np.concatenate((i, j))
+
+
+def resolve_collisions(coords, velocity, r, i, j):
+    coords, velocity = coords.copy(), velocity.copy()
+    m = r * r
+    hit = list()
+    while len(i) > 0:
+        # resolve a batch of pairs sharing no ball, then retry the rest
+        ids = np.stack((i, j), axis=1).ravel()
+        first = np.zeros(len(ids), dtype=bool)
+        first[np.unique(ids, return_index=True)[1]] = True
+        batch = np.all(first.reshape(-1, 2), axis=1)
+        hit.append(_resolve_pairs(coords, velocity, m, r, i[batch], j[batch]))
+        i, j = i[~batch], j[~batch]
+    return (coords, velocity, np.unique(np.concatenate(hit)))
+
+
+_circle_templates = dict()
+
+
+def get_circle_template(samples, r):
+    key = (samples, float(r), get_dtype())
+    if key not in _circle_templates:
+        t = np.asarray(range(samples)) * 2 * math.pi / (samples - 1)
+        template = np.asarray((np.cos(t), np.sin(t)), dtype=get_dtype()) * r
+        template.flags.writeable = False
+        _circle_templates[key] = template
+    return _circle_templates[key]
+
+
+def draw_circle(coord, r, samples, out=None):
+    template = get_circle_template(samples, r)
+    if out is None or out.shape != template.shape:
+        out = np.empty_like(template)
+    np.add(template, np.reshape(coord, (2, 1)), out=out)
+    return out
+
 
 class Object(object):
     def __init__(self, move, region, samples=100):
@@ -17,11 +92,15 @@ class Object(object):
 
 
 class Ball(Object):
-    def __init__(self, move, region, r, **kwargs):
+    def __init__(self, move, region, r, swept=False, max_bounces=8,
+                 **kwargs):
         super().__init__(move, region, **kwargs)
         self.r = r
+        self.swept = swept
+        self.max_bounces = max_bounces
         self._prev = self._region.get_closest_line(self._move.get_coord())
         self._trigger = list()
+        self._outline = None
 
     def _check_collision(self, coord):
         line1, r1 = self._region.get_closest_line(coord)
@@ -33,21 +112,43 @@ class Ball(Object):
         self._prev = (line1, r1)
         return None
 
-    def __call__(self, dt):
-        coord = self._move(dt)
-        line = self._check_collision(coord)
-        if line is not None:
-            coord = line.get_symmetry_point(coord, margin=self.r)
+    def _on_collision(self, coord, velocity):
+        for trig in filter(lambda t: t is not None, self._trigger):
+            trig.call(coord=coord, velocity=velocity)
+
+    def _sweep(self, dt):
+        for _ in range(self.max_bounces):
+            c1, v1 = self._move.get_coord(), self._move.get_velocity()
+            c2 = self._move(dt)
+            line, t = self._region.get_impact(c1, c2, self.r)
+            if line is None:
+                return c2
+
+            v2 = self._move.get_velocity()
+            coord = c1 + (c2 - c1) * t
             self._move.set_coord(coord)
-            velocity = line.get_reflect_vector(self._move.get_velocity())
+            velocity = line.get_reflect_vector(v1 + (v2 - v1) * t)
             self._move.set_velocity(velocity)
-            for trig in filter(lambda t: t is not None, self._trigger):
-                trig.call(coord=coord, velocity=velocity)
+            self._on_collision(coord, velocity)
+            dt = dt * (1.0 - t)
+        return self._move.get_coord()
 
-        t = np.asarray(range(self.samples)) * 2 * math.pi / (self.samples - 1)
-        xs = np.cos(t) * self.r + coord[0]
-        ys = np.sin(t) * self.r + coord[1]
-        return (xs, ys)
+    def __call__(self, dt):
+        if self.swept:
+            coord = self._sweep(dt)
+        else:
+            coord = self._move(dt)
+            line = self._check_collision(coord)
+            if line is not None:
+                coord = line.get_symmetry_point(coord, margin=self.r)
+                self._move.set_coord(coord)
+                velocity = line.get_reflect_vector(self._move.get_velocity())
+                self._move.set_velocity(velocity)
+                self._on_collision(coord, velocity)
+
+        self._outline = draw_circle(coord, self.r, self.samples,
+                                    self._outline)
+        return (self._outline[0], self._outline[1])
 
     def add_collision_trigger(self, trigger):
         self._trigger.append(trigger)
@@ -60,17 +161,93 @@ class Ball(Object):
         return self._move.get_coord()
 
 
+class BallCollision(object):
+    def __init__(self, balls=None):
+        self._balls = list() if balls is None else list(balls)
+
+    def add_ball(self, ball):
+        self._balls.append(ball)
+
+    def __call__(self, dt):
+        if len(self._balls) > 1:
+            self.resolve()
+
+    def resolve(self):
+        coords = np.asarray([b.get_coord() for b in self._balls],
+                            dtype=get_dtype())
+        r = np.asarray([b.r for b in self._balls], dtype=get_dtype())
+        i, j = sweep_and_prune(coords, r)
+        if len(i) == 0:
+            return
+
+        velocity = np.asarray([b._move.get_velocity() for b in self._balls],
+                              dtype=get_dtype())
+        coords, velocity, hit = resolve_collisions(coords, velocity, r, i, j)
+        for k in hit:
+            ball = self._balls[k]
+            ball._move.set_coord(coords[k])
+            ball._move.set_velocity(velocity[k])
+            ball._on_collision(coords[k], ball._move.get_velocity())
+
+
+class Circle(object):
+    def __init__(self, move, r, samples=100):
+        self._move = move
+        self.r = r
+        self.samples = samples
+        self._outline = None
+
+    def __call__(self, dt):
+        coord = self._move(dt)
+        self._outline = draw_circle(coord, self.r, self.samples,
+                                    self._outline)
+        return (self._outline[0], self._outline[1])
+
+
 class Trace(Object):
-    def __init__(self, obj, idx=0):
-        if isinstance(obj._move, list):
-            self._move = obj._move[idx]
+    def __init__(self, obj, idx=0, max_length=None, capacity=1024):
+        if isinstance(obj, Nodes):
+            self._get_coord = lambda: obj.get_vertices()[idx]
         else:
-            self._move = obj._move
-        self._trace = list()
+            self._get_coord = obj._move.get_coord
+        self.max_length = max_length
+        if max_length is None:
+            self._trace = np.empty((capacity, 2), dtype=get_dtype())
+        else:
+            self._trace = np.empty((2 * max_length, 2), dtype=get_dtype())
+        self._count = 0
+
+    def _append(self, coord):
+        if len(self._trace) == self._count:
+            trace = np.empty((2 * len(self._trace), 2), dtype=get_dtype())
+            trace[:self._count] = self._trace
+            self._trace = trace
+        self._trace[self._count] = coord
+        self._count += 1
+        return self._trace[:self._count]
+
+    def _append_ring(self, coord):
+        '''
+            Each coord is written twice so that the last max_length
+            coords are always a contiguous slice.
+            trace: | 3 4 5 | 3 4 5 |  (count = 6, max_length = 3)
+                     ^^^^^
+        '''
+        n = self.max_length
+        idx = self._count % n
+        self._trace[idx] = coord
+        self._trace[idx + n] = coord
+        self._count += 1
+        if self._count < n:
+            return self._trace[:self._count]
+        start = self._count % n
+        return self._trace[start:start + n]
 
     def __call__(self, dt):
-        self._trace.append(self._move.get_coord())
-        return np.asarray(self._trace, dtype=np.float32).T
+        coord = self._get_coord()
+        if self.max_length is None:
+            return self._append(coord).T
+        return self._append_ring(coord).T
 
 
 class Particle(Object):
@@ -80,83 +257,155 @@ class Particle(Object):
 
 
 class Nodes(Object):
-    def __init__(self, move, region, apexes):
+    def __init__(self, move, region, apexes, omega=0.0):
         super().__init__(move, region)
-        apexes = np.asarray([*apexes, *apexes[0:2]], dtype=np.float32)
-        self._nodes = list()
-        for i in range(len(apexes) - 2):
-            c1, c2, c3 = apexes[i:i + 3]
-            v1, v2 = c1 - c2, c2 - c3
-            l1, l2 = np.sqrt(v1 @ v1), np.sqrt(v2 @ v2)
-            v1, v2 = v1 / l1, v2 / l2
-            t1, t2 = math.atan2(*v1[::-1]), math.atan2(*v2[::-1])
-            self._nodes.append((t2 - t1, l2))
-        self._move = [move.copy() for i in range(len(apexes) - 3)]
-        self._move = [move, *self._move]
-        for i, move in enumerate(self._move):
-            move.set_coord(apexes[i])
-
-    def on_collision(self, idx, dt):
-        n = len(self._move)
-        cs = [move.get_coord() for move in self._move]
-
-        c1 = self._move[idx].get_coord()
-        v1 = self._move[idx].get_velocity()
-        line, _ = self._region.get_closest_line(c1)
-        cp1 = line.get_symmetry_point(c1)
-        vp1 = line.get_reflect_vector(v1)
-        self._move[idx].set_coord(cp1)
-        self._move[idx].set_velocity(vp1)
-
-        c2 = self._move[(idx + 1) % n].get_coord()
-        v2 = self._move[(idx + 1) % n].get_velocity()
-        s1 = -v2 @ (c2 - cp1)
-        s2 = np.sqrt((v2 @ (c2 - cp1)) ** 2 - (v2 @ v2) *
-                     ((c2 - cp1) @ (c2 - cp1) - (c2 - c1) @ (c2 - c1)))
-        s = s1 + s2 if abs(s1 + s2) < abs(s1 - s2) else s1 - s2
-        cp2 = c2 + v2 * s / (v2 @ v2)
-        vp2 = (cp2 - c2) / dt + v2
-        tvp2 = math.atan2(*vp2[::-1])
-        vp2 = np.asarray([np.cos(tvp2), np.sin(tvp2)], dtype=np.float32)
-        print('(%.3f, %.3f) -> (%.3f, %.3f)' % (*v2, *vp2))
-        self._move[(idx + 1) % n].set_coord(cp2)
-        self._move[(idx + 1) % n].set_velocity(vp2)
-
-        for i in range(2, n):
-            t0 = math.atan2(*(cp2 - cp1)[::-1])
-            t3, l3 = self._nodes[(idx + i - 1) % n]
-            d3 = np.asarray([math.cos(t0 + t3), math.sin(t0 + t3)],
-                            dtype=np.float32) * l3
-            c3 = self._move[(idx + i) % n].get_coord()
-            v3 = self._move[(idx + i) % n].get_velocity()
-            cp3 = cp2 + d3
-            vp3 = (c3 - cp3) / dt + v3
-            tvp3 = math.atan2(*vp3[::-1])
-            vp3 = np.asarray([np.cos(tvp3), np.sin(tvp3)], dtype=np.float32)
-            print('(%.3f, %.3f) -> (%.3f, %.3f)' % (*v3, *vp3))
-            self._move[(idx + i) % n].set_coord(cp3)
-            self._move[(idx + i) % n].set_velocity(vp3)
-            cp1 = cp2
-            cp2 = cp3
-        cs = [move.get_coord() for move in self._move]
+        apexes = np.asarray(apexes, dtype=get_dtype())
+        center = apexes.mean(axis=0)
+        self._local = apexes - center
+        self._inertia = float(np.mean(np.sum(self._local ** 2, axis=1)))
+        self._move.set_coord(center)
+        self.angle = 0.0
+        self.omega = omega
+
+    def _get_rotation(self):
+        c, s = math.cos(self.angle), math.sin(self.angle)
+        return np.asarray([[c, -s], [s, c]], dtype=get_dtype())
+
+    def get_vertices(self):
+        return self._local @ self._get_rotation().T + self._move.get_coord()
+
+    def on_collision(self, vertices, outside):
+        idx, _ = self._region.get_closest_lines(vertices[outside])
+        points = vertices[outside][idx >= 0]
+        idx = idx[idx >= 0]
+        if len(idx) == 0:
+            return
+
+        lines = self._region._lines
+        center = self._move.get_coord()
+        n = lines.normals[idx]
+        side = np.sign(n @ center + lines.offsets[idx])
+        n = n * side[:, np.newaxis]
+        depth = -np.sum(n * points, axis=1) - side * lines.offsets[idx]
+
+        r = points - center
+        rn = r[:, 0] * n[:, 1] - r[:, 1] * n[:, 0]
+        v = self._move.get_velocity()
+        omega = self.omega
+        # contacts are resolved one at a time, deepest first, each seeing
+        # the velocity left by the previous impulses
+        for k in np.argsort(-depth):
+            vn = (v[0] - omega * r[k, 1]) * n[k, 0] + \
+                (v[1] + omega * r[k, 0]) * n[k, 1]
+            if vn < 0:
+                j = -2 * vn / (1 + rn[k] ** 2 / self._inertia)
+                v = v + j * n[k]
+                omega = omega + j * rn[k] / self._inertia
+
+        deepest = np.argmax(depth)
+        self._move.set_coord(center + max(depth[deepest], 0) * n[deepest])
+        self._move.set_velocity(v)
+        self.omega = omega * getattr(self._move, '_elasticity', 1.0)
 
     def __call__(self, dt):
-        coords = [move(dt) for move in self._move]
-        for i, coord in enumerate(coords):
-            if coord not in self._region:
-                self.on_collision(i, dt)
-        coords = [move.get_coord() for move in self._move]
-        return np.asarray([*coords, coords[0]], dtype=np.float32).T
+        self._move(dt)
+        self.angle += self.omega * dt
+        vertices = self.get_vertices()
+        outside = ~self._region.contains(vertices)
+        if np.any(outside):
+            self.on_collision(vertices, outside)
+            vertices = self.get_vertices()
+        return np.concatenate((vertices, vertices[:1])).T
 
     def get_coord(self):
-        return [move.get_coord() for move in self._move]
+        return list(self.get_vertices())
 
 
 class Area(Object):
     def __init__(self, move, region):
         super().__init__(move, region)
         apexes = [*self._region.apexes, self._region.apexes[0]]
-        self.apexes = np.asarray(apexes, dtype=np.float32).T
+        self.apexes = np.asarray(apexes, dtype=get_dtype()).T
 
     def __call__(self, dt):
         return self.apexes
+
+
+class ParticleSystem(Object):
+    def __init__(self, region, coords, velocity=[0, 0], accel=[0, 0],
+                 r=0.05, elasticity=1.0, gamma=0.0, samples=32,
+                 collide=False):
+        self._region = region
+        self.samples = samples
+        self.collide = collide
+        self._coord = np.array(coords, dtype=get_dtype()).reshape(-1, 2)
+        n = len(self._coord)
+        self._velocity = self._broadcast(velocity, (n, 2))
+        self._accel = self._broadcast(accel, (n, 2))
+        self.r = self._broadcast(r, (n,))
+        self._elasticity = self._broadcast(elasticity, (n,))
+        self._gamma = self._broadcast(gamma, (n,))
+        _, self._prev = self._region.get_closest_lines(self._coord)
+
+        self._circle = get_circle_template(samples, 1.0)
+        self._outline = np.full((2, n, samples + 1), np.nan, dtype=get_dtype())
+
+    @staticmethod
+    def _broadcast(value, shape):
+        value = np.asarray(value, dtype=get_dtype())
+        return np.broadcast_to(value, shape).copy()
+
+    def __len__(self):
+        return len(self._coord)
+
+    def _check_collision(self):
+        idx, distance = self._region.get_closest_lines(self._coord)
+        hit = (distance <= self.r) & (self.r < self._prev)
+        self._prev = np.where(hit, self._prev, distance)
+        return (idx, hit)
+
+    def _on_collision(self, idx, hit):
+        lines = self._region._lines
+        self._coord[hit] = lines.get_symmetry_points(
+            self._coord[hit], idx[hit], margin=self.r[hit])
+        velocity = lines.get_reflect_vectors(self._velocity[hit], idx[hit])
+        self._velocity[hit] = velocity * self._elasticity[hit, np.newaxis]
+
+    def step(self, dt):
+        amp = (1 - self._gamma * dt)[:, np.newaxis]
+        self._coord += self._velocity * dt
+        self._velocity = self._velocity * amp + self._accel * dt
+        idx, hit = self._check_collision()
+        if np.any(hit):
+            self._on_collision(idx, hit)
+        if self.collide:
+            self._collide()
+
+    def _collide(self):
+        i, j = sweep_and_prune(self._coord, self.r)
+        if len(i) == 0:
+            return
+        coord, velocity, hit = resolve_collisions(self._coord, self._velocity,
+                                                  self.r, i, j)
+        self._coord = coord
+        self._velocity[hit] = velocity[hit] * self._elasticity[hit, np.newaxis]
+
+    def __call__(self, dt):
+        self.step(dt)
+        outline = self._outline[:, :, :self.samples]
+        np.multiply(self._circle[:, np.newaxis, :],
+                    self.r[np.newaxis, :, np.newaxis], out=outline)
+        outline += self._coord.T[:, :, np.newaxis]
+        return (self._outline[0].ravel(), self._outline[1].ravel())
+
+    def get_coords(self):
+        return self._coord.copy()
+
+    def get_velocities(self):
+        return self._velocity.copy()
+
+    def set_velocities(self, velocity, use_elasticity=False):
+        velocity = self._broadcast(velocity, self._velocity.shape)
+        if use_elasticity:
+            velocity = velocity * self._elasticity[:, np.newaxis]
+        self._velocity = velocity
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+
+_dtype = np.float32
+
+
+def set_dtype(dtype):
+    '''
+        Arrays keep the dtype they were created with, so call this before
+        building any Move, Line, Region or Object.
+    '''
+    global _dtype
+    dtype = np.dtype(dtype).type
+    if dtype not in (np.float32, np.float64):
+        raise ValueError('dtype must be float32 or float64: %s' % dtype)
+    _dtype = dtype
+
+
+def get_dtype():
+    return _dtype
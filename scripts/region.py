@@ -1,18 +1,21 @@
 # -*- coding: utf-8 -*-
 
+import math
 import numpy as np
 
+from precision import get_dtype
+
 
 class Domain(object):
     def __init__(self, xmax=np.inf, xmin=-np.inf):
         xmax = np.inf if xmax is None else xmax
         xmin = -np.inf if xmin is None else xmin
-        self._range = np.asarray(sorted([xmax, xmin]), dtype=np.float32)
+        self._range = np.asarray(sorted([xmax, xmin]), dtype=get_dtype())
 
     def set_props(self, xmax=None, xmin=None):
         xmax = self._range[1] if xmax is None else xmax
         xmin = self._range[0] if xmin is None else xmin
-        self._range = np.asarray(sorted([xmax, xmin]), dtype=np.float32)
+        self._range = np.asarray(sorted([xmax, xmin]), dtype=get_dtype())
 
     def __call__(self, x):
         return self._range[0] <= x <= self._range[1]
@@ -78,9 +81,11 @@ class Domain(object):
 
 class Line(object):
     def __init__(self, a1=1, a2=1, b=0, domain=None, yrange=None):
-        a = np.asarray([a1, a2], dtype=np.float32)
+        a = np.asarray([a1, a2], dtype=get_dtype())
         self._n = a / np.sqrt(a @ a)
         self._b = b / np.sqrt(a @ a)
+        self._reflect = np.eye(2, dtype=get_dtype()) - \
+            2 * np.outer(self._n, self._n)
         self.domain = Domain() if domain is None else domain
         self.yrange = Domain() if yrange is None else yrange
 
@@ -98,23 +103,18 @@ class Line(object):
     def func(self, x, y, ignore_domain=False):
         if not self.domain(x) and not ignore_domain:
             return np.nan
-        return self._n @ [x, y] + self._b
+        return self._n[0] * x + self._n[1] * y + self._b
 
     def get_distance(self, x, y):
-        f = self.func(x, y, ignore_domain=True)
-        return np.abs(f) / np.sqrt(self._n @ self._n)
+        return abs(self.func(x, y, ignore_domain=True))
 
     def get_symmetry_point(self, x, margin=0.0):
-        t = - (self._n @ x + self._b) / (self._n @ self._n)
+        t = -(self._n @ x + self._b)
         t = t - margin if t > 0 else t + margin
         return x + 2 * t * self._n
 
     def get_reflect_vector(self, v):
-        n = self._n
-        A = np.asarray((n, n[::-1] * [-1, 1]), dtype=np.float32)
-        Ainv = np.asarray((n * [1, -1], n[::-1]), dtype=np.float32)
-        v = (A @ v) * [-1, 1]
-        return Ainv @ v
+        return self._reflect @ v
 
     def is_clossed(self, line):
         if np.all(self._n == line._n):
@@ -150,50 +150,425 @@ def get_line_from_coords(coord1, coord2):
 
 
 def get_line_from_gradient(gradient, coord, domain=None):
-    coord = np.asarray(coord, dtype=np.float32)
+    coord = np.asarray(coord, dtype=get_dtype())
     a1 = 0.0 if gradient is np.inf else 1.0
     a2 = 1.0 if gradient is np.inf else gradient
-    b = -([a1, a2] @ coord)
+    b = -(a1 * coord[0] + a2 * coord[1])
     return Line(a1=a1, a2=a2, b=b, domain=domain)
 
 
+class LineArray(object):
+    def __init__(self, lines):
+        self.lines = list(lines)
+        n = len(self.lines)
+        self.normals = np.asarray([line._n for line in self.lines],
+                                  dtype=get_dtype()).reshape(n, 2)
+        self.offsets = np.asarray([line._b for line in self.lines],
+                                  dtype=get_dtype()).reshape(n)
+        self.domains = np.asarray([line.domain._range for line in self.lines],
+                                  dtype=get_dtype()).reshape(n, 2)
+        self.yranges = np.asarray([line.yrange._range for line in self.lines],
+                                  dtype=get_dtype()).reshape(n, 2)
+        self.reflections = np.asarray([line._reflect for line in self.lines],
+                                      dtype=get_dtype()).reshape(n, 2, 2)
+
+    def __len__(self):
+        return len(self.normals)
+
+    def take(self, idx):
+        lines = LineArray(list())
+        lines.lines = [self.lines[i] for i in idx]
+        lines.normals = self.normals[idx]
+        lines.offsets = self.offsets[idx]
+        lines.domains = self.domains[idx]
+        lines.yranges = self.yranges[idx]
+        lines.reflections = self.reflections[idx]
+        return lines
+
+    def contains(self, coords):
+        xs = coords[:, 0, np.newaxis]
+        ys = coords[:, 1, np.newaxis]
+        return ((self.domains[:, 0] <= xs) & (xs <= self.domains[:, 1]) &
+                (self.yranges[:, 0] <= ys) & (ys <= self.yranges[:, 1]))
+
+    def contains_each(self, coords):
+        xs, ys = coords[:, 0], coords[:, 1]
+        return ((self.domains[:, 0] <= xs) & (xs <= self.domains[:, 1]) &
+                (self.yranges[:, 0] <= ys) & (ys <= self.yranges[:, 1]))
+
+    def func(self, coords):
+        return coords @ self.normals.T + self.offsets
+
+    def get_signed_distances(self, coords, idx=None):
+        '''
+            idx is None : (N, 2) coords x all M lines -> (N, M)
+            idx given   : coords[i] x lines[idx[i]]   -> (N,)
+        '''
+        if idx is None:
+            return self.func(coords)
+        return np.sum(self.normals[idx] * coords, axis=1) + self.offsets[idx]
+
+    def get_distances(self, coords, idx=None):
+        return np.abs(self.get_signed_distances(coords, idx))
+
+    def get_symmetry_points(self, coords, idx=None, margin=0.0):
+        t = -self.get_signed_distances(coords, idx)
+        t = np.where(t > 0, t - margin, t + margin)
+        if idx is None:
+            return coords[:, np.newaxis, :] + \
+                2 * t[..., np.newaxis] * self.normals
+        return coords + 2 * t[:, np.newaxis] * self.normals[idx]
+
+    def get_reflect_vectors(self, vs, idx=None):
+        if idx is None:
+            return np.einsum('mij,nj->nmi', self.reflections, vs)
+        return np.einsum('nij,nj->ni', self.reflections[idx], vs)
+
+
+class SlabIndex(object):
+    '''
+        cells : |--0--|--1--|--2--|--3--|
+        item  :    @@@@@@@@@@@             -> cells 0, 1, 2
+    '''
+    def __init__(self, ranges, idx, cells):
+        self._idx = np.asarray(idx, dtype=np.int64)
+        ranges = np.asarray(ranges, dtype=np.float64)[self._idx]
+        self.cells = cells
+        if len(ranges) == 0:
+            self._lo, self._hi, self._width = 0.0, -1.0, 1.0
+        else:
+            self._lo, self._hi = ranges[:, 0].min(), ranges[:, 1].max()
+            self._width = (self._hi - self._lo) / cells or 1.0
+
+        c0, c1 = self._get_cell(ranges[:, 0]), self._get_cell(ranges[:, 1])
+        counts = c1 - c0 + 1
+        cell = np.repeat(c0 - np.cumsum(counts) + counts, counts)
+        cell = cell + np.arange(counts.sum())
+        items = np.repeat(np.arange(len(ranges)), counts)
+        order = np.argsort(cell, kind='stable')
+        self._items = self._idx[items[order]]
+        self._offsets = np.searchsorted(cell[order], np.arange(cells + 1))
+
+    def _get_cell(self, xs):
+        cell = np.floor((np.asarray(xs, dtype=np.float64) - self._lo) /
+                        self._width)
+        return np.clip(cell, 0, self.cells - 1).astype(np.int64)
+
+    def query(self, lo, hi):
+        lo, hi = max(np.min(lo), self._lo), min(np.max(hi), self._hi)
+        if not lo <= hi:
+            return self._items[:0]
+        c0 = min(math.floor((lo - self._lo) / self._width), self.cells - 1)
+        c1 = min(math.floor((hi - self._lo) / self._width), self.cells - 1)
+        return self._items[self._offsets[c0]:self._offsets[c1 + 1]]
+
+    def query_each(self, values):
+        '''
+            one lookup per value, returned as (value idx, item) pairs
+        '''
+        values = np.asarray(values, dtype=np.float64)
+        cell = self._get_cell(values)
+        start = self._offsets[cell]
+        counts = np.where((self._lo <= values) & (values <= self._hi),
+                          self._offsets[cell + 1] - start, 0)
+        vi = np.repeat(np.arange(len(values)), counts)
+        ii = np.arange(counts.sum()) + np.repeat(start - np.cumsum(counts) +
+                                                 counts, counts)
+        return (vi, self._items[ii])
+
+
+class GridIndex(object):
+    def __init__(self, lines, cells):
+        xfinite = np.all(np.isfinite(lines.domains), axis=1)
+        yfinite = np.all(np.isfinite(lines.yranges), axis=1)
+        self._xindex = SlabIndex(lines.domains, np.flatnonzero(xfinite),
+                                 cells)
+        self._yindex = SlabIndex(lines.yranges,
+                                 np.flatnonzero(~xfinite & yfinite), cells)
+        self._always = np.flatnonzero(~xfinite & ~yfinite)
+
+    def query(self, xmin, xmax, ymin, ymax):
+        return np.unique(np.concatenate([self._xindex.query(xmin, xmax),
+                                         self._yindex.query(ymin, ymax),
+                                         self._always]))
+
+    def query_each(self, xs, ys):
+        xi, xe = self._xindex.query_each(xs)
+        yi, ye = self._yindex.query_each(ys)
+        ai = np.repeat(np.arange(len(xs)), len(self._always))
+        ae = np.tile(self._always, len(xs))
+        return (np.concatenate((xi, yi, ai)), np.concatenate((xe, ye, ae)))
+
+
+class SegmentSweep(object):
+    '''
+        edges are sorted by xmin. A query [x0, x1] can only meet the edges
+        with x0 - width <= xmin <= x1, where width is the widest edge.
+
+        xmin  : --@----@--@-----@---@------
+        query :        |<-------->|
+    '''
+    def __init__(self, p, q):
+        p = np.asarray(p, dtype=np.float64).reshape(-1, 2)
+        q = np.asarray(q, dtype=np.float64).reshape(-1, 2)
+        lo, hi = np.minimum(p, q), np.maximum(p, q)
+        self._order = np.argsort(lo[:, 0], kind='stable')
+        self._p, self._q = p[self._order], q[self._order]
+        self._lo, self._hi = lo[self._order], hi[self._order]
+        self._width = (hi[:, 0] - lo[:, 0]).max() if len(p) > 0 else 0.0
+
+    def __len__(self):
+        return len(self._p)
+
+    def candidates(self, a, b):
+        lo, hi = np.minimum(a, b), np.maximum(a, b)
+        start = np.searchsorted(self._lo[:, 0], lo[:, 0] - self._width)
+        stop = np.searchsorted(self._lo[:, 0], hi[:, 0], side='right')
+        counts = np.maximum(stop - start, 0)
+        qi = np.repeat(np.arange(len(a)), counts)
+        ei = np.arange(counts.sum()) + np.repeat(start - np.cumsum(counts) +
+                                                 counts, counts)
+        keep = ((self._hi[ei, 0] >= lo[qi, 0]) &
+                (self._hi[ei, 1] >= lo[qi, 1]) &
+                (self._lo[ei, 1] <= hi[qi, 1]))
+        return (qi[keep], ei[keep])
+
+    def intersect(self, a, b):
+        '''
+            a + t(b - a) = p + u(q - p), 0 <= t, u <= 1
+            returns (query idx, edge idx, t, u) of every crossing
+        '''
+        a = np.asarray(a, dtype=np.float64).reshape(-1, 2)
+        b = np.asarray(b, dtype=np.float64).reshape(-1, 2)
+        qi, ei = self.candidates(a, b)
+        r, s = b[qi] - a[qi], self._q[ei] - self._p[ei]
+        d = self._p[ei] - a[qi]
+        denom = r[:, 0] * s[:, 1] - r[:, 1] * s[:, 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (d[:, 0] * s[:, 1] - d[:, 1] * s[:, 0]) / denom
+            u = (d[:, 0] * r[:, 1] - d[:, 1] * r[:, 0]) / denom
+        hit = (denom != 0) & (0 <= t) & (t <= 1) & (0 <= u) & (u <= 1)
+        return (qi[hit], self._order[ei[hit]], t[hit], u[hit])
+
+    def overlaps(self, a, b, eps=1e-12):
+        '''
+            returns (query idx, edge idx) of collinear pairs that share
+            more than a point, which intersect() skips as parallel
+        '''
+        a = np.asarray(a, dtype=np.float64).reshape(-1, 2)
+        b = np.asarray(b, dtype=np.float64).reshape(-1, 2)
+        qi, ei = self.candidates(a, b)
+        r, s = b[qi] - a[qi], self._q[ei] - self._p[ei]
+        d1, d2 = self._p[ei] - a[qi], self._q[ei] - a[qi]
+        rr = np.sum(r * r, axis=1)
+        scale = eps * rr
+        parallel = ((np.abs(r[:, 0] * s[:, 1] - r[:, 1] * s[:, 0]) <=
+                     eps * np.sqrt(rr * np.sum(s * s, axis=1))) &
+                    (np.abs(d1[:, 0] * r[:, 1] - d1[:, 1] * r[:, 0]) <=
+                     eps * np.sqrt(rr * np.sum(d1 * d1, axis=1))))
+        t1, t2 = np.sum(d1 * r, axis=1), np.sum(d2 * r, axis=1)
+        lo = np.maximum(np.minimum(t1, t2), 0.0)
+        hi = np.minimum(np.maximum(t1, t2), rr)
+        hit = parallel & (hi - lo > scale)
+        return (qi[hit], self._order[ei[hit]])
+
+    def first_hits(self, a, b):
+        qi, ei, t, _ = self.intersect(a, b)
+        idx = np.full(len(np.reshape(a, (-1, 2))), -1, dtype=np.int64)
+        ts = np.full(len(idx), np.inf)
+        order = np.lexsort((t, qi))
+        first = order[np.unique(qi[order], return_index=True)[1]]
+        idx[qi[first]] = ei[first]
+        ts[qi[first]] = t[first]
+        return (idx, ts)
+
+
 class Region(object):
-    def __init__(self, apexes):
+    def __init__(self, apexes, cells=None):
         self.lines = list()
         self.apexes = apexes
         for i in range(len(apexes)):
             c1 = apexes[i]
             c2 = apexes[(i + 1) % len(apexes)]
             self.lines.append(get_line_from_coords(c1, c2))
+        self._lines = LineArray(self.lines)
+        apexes = np.asarray(apexes, dtype=np.float64).reshape(-1, 2)
+        self._sweep = SegmentSweep(apexes, np.roll(apexes, -1, axis=0))
+
+        if cells is None:
+            cells = len(self.lines) // 8 if len(self.lines) >= 2048 else 0
+        self._index = GridIndex(self._lines, cells) if cells > 0 else None
+
+    def _get_candidates(self, xmin, xmax, ymin, ymax):
+        '''
+            edges near one query box; batches of points use _get_pairs
+        '''
+        if self._index is None:
+            return (None, self._lines)
+        idx = self._index.query(xmin, xmax, ymin, ymax)
+        return (idx, self._lines.take(idx))
+
+    def _get_pairs(self, coords):
+        '''
+            (point idx, edge idx) pairs of the index cells each point is in
+        '''
+        pi, ei = self._index.query_each(coords[:, 0], coords[:, 1])
+        lines = self._lines
+        inside = ((lines.domains[ei, 0] <= coords[pi, 0]) &
+                  (coords[pi, 0] <= lines.domains[ei, 1]) &
+                  (lines.yranges[ei, 0] <= coords[pi, 1]) &
+                  (coords[pi, 1] <= lines.yranges[ei, 1]))
+        return (pi[inside], ei[inside])
+
+    def contains(self, coords):
+        coords = np.asarray(coords, dtype=get_dtype()).reshape(-1, 2)
+        if self._index is not None:
+            pi, ei = self._get_pairs(coords)
+            n = self._lines.normals[ei]
+            pi, ei, n = pi[n[:, 1] != 0], ei[n[:, 1] != 0], n[n[:, 1] != 0]
+            ys = -(coords[pi, 0] * n[:, 0] + self._lines.offsets[ei]) / n[:, 1]
+            crossed = np.bincount(pi[ys >= coords[pi, 1]],
+                                  minlength=len(coords))
+            return crossed % 2 == 1
+
+        lines = self._lines
+        n = lines.normals
+        mask = lines.contains(coords) & (n[:, 1] != 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ys = -(coords[:, 0, np.newaxis] * n[:, 0] +
+                   lines.offsets) / n[:, 1]
+        crossed = mask & (ys >= coords[:, 1, np.newaxis])
+        return np.count_nonzero(crossed, axis=1) % 2 == 1
 
     def __contains__(self, coord):
-        is_contain = False
-        for line in filter(lambda l: coord in l, self.lines):
-            if np.isnan(line(coord[0])):
-                continue
-            if line(coord[0]) >= coord[1]:
-                is_contain = not is_contain
-        return is_contain
+        return bool(self.contains(coord)[0])
 
     def get_crossed_line(self, coord1, coord2):
         trace = get_line_from_coords(coord1, coord2)
         closest_distance = np.inf
         clossed = None
 
-        for line in filter(lambda l: l.is_clossed(trace), self.lines):
+        lines = self.lines
+        if self._index is not None:
+            idx = self._index.query(*trace.domain, -np.inf, np.inf)
+            parallel = np.all(self._lines.normals == trace._n, axis=1)
+            idx = np.union1d(idx, np.flatnonzero(parallel))
+            lines = [self.lines[i] for i in idx]
+
+        for line in filter(lambda l: l.is_clossed(trace), lines):
             distance = line.get_distance(*coord1)
             if distance < closest_distance:
                 closest_distance = distance
                 clossed = line
         return clossed
 
-    def get_closest_line(self, coord):
-        closest_distance = np.inf
-        closest = None
+    def get_crossed_lines(self, coords1, coords2):
+        return self._sweep.first_hits(coords1, coords2)
 
-        for line in filter(lambda l: coord in l, self.lines):
-            distance = line.get_distance(*coord)
-            if distance < closest_distance:
-                closest_distance = distance
-                closest = line
-        return (closest, closest_distance)
+    def is_simple(self):
+        n = len(self._sweep)
+        if n < 3:
+            return False
+        apexes = np.asarray(self.apexes, dtype=np.float64).reshape(-1, 2)
+        ends = np.roll(apexes, -1, 0)
+        qi, ei, _, _ = self._sweep.intersect(apexes, ends)
+        gap = (ei - qi) % n
+        if np.any((gap != 0) & (gap != 1) & (gap != n - 1)):
+            return False
+        qi, ei = self._sweep.overlaps(apexes, ends)
+        return not np.any(qi != ei)
+
+    def get_impact(self, coord1, coord2, r=0.0):
+        c1 = np.asarray(coord1, dtype=get_dtype())
+        c2 = np.asarray(coord2, dtype=get_dtype())
+        lo, hi = np.minimum(c1, c2) - r, np.maximum(c1, c2) + r
+        candidates, lines = self._get_candidates(lo[0], hi[0], lo[1], hi[1])
+        if len(lines) == 0:
+            return (None, 1.0)
+
+        d1, d2 = lines.func(np.stack((c1, c2)))
+        side = np.where(d1 < 0, -1.0, 1.0)
+        approach = (side * d2 < side * d1) & (side * d2 < r)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.clip((d1 - side * r) / (d1 - d2), 0.0, 1.0)
+        contacts = c1 + t[:, np.newaxis] * (c2 - c1)
+        contacts = contacts - (side * r)[:, np.newaxis] * lines.normals
+        on_edge = lines.contains_each(contacts)
+        t = np.where(approach & on_edge, t, np.inf)
+
+        idx = np.argmin(t)
+        if np.isinf(t[idx]):
+            return (None, 1.0)
+        if candidates is not None:
+            idx = candidates[idx]
+        return (self.lines[idx], float(t.min()))
+
+    def get_parabola_impacts(self, coord, velocity, accel, r=0.0, eps=1e-9):
+        '''
+            earliest t >= 0 at which the circle touches each edge, inf if
+            never. A circle already touching an edge and pressed into it
+            (by velocity or accel) touches it at t = 0.
+        '''
+        c = np.asarray(coord, dtype=np.float64)
+        v = np.asarray(velocity, dtype=np.float64)
+        a = np.asarray(accel, dtype=np.float64)
+        n = self._lines.normals.astype(np.float64)
+
+        d = n @ c + self._lines.offsets
+        side = np.where(d < 0, -1.0, 1.0)
+        qa, qb = 0.5 * side * (n @ a), side * (n @ v)
+        qc = np.maximum(side * d - r, 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            disc = np.sqrt(qb * qb - 4 * qa * qc)
+            roots = np.stack(((-qb - disc) / (2 * qa),
+                              (-qb + disc) / (2 * qa)))
+            roots = np.where(qa == 0, -qc / qb, roots)
+
+        valid = np.isfinite(roots) & (roots >= -eps)
+        roots = np.where(valid, np.maximum(roots, 0.0), 0.0)
+        rate = 2 * qa * roots + qb
+        approach = (rate < 0) | ((rate == 0) & (qa < 0))
+        contacts = c + v * roots[..., np.newaxis] + \
+            0.5 * a * roots[..., np.newaxis] ** 2
+        contacts = contacts - (side * r)[:, np.newaxis] * n
+        on_edge = np.stack([self._lines.contains_each(p) for p in contacts])
+        return np.where(valid & approach & on_edge, roots, np.inf).min(axis=0)
+
+    def get_parabola_impact(self, coord, velocity, accel, r=0.0, eps=1e-9):
+        if len(self._lines) == 0:
+            return (None, np.inf)
+        t = self.get_parabola_impacts(coord, velocity, accel, r, eps)
+        idx = np.argmin(t)
+        if np.isinf(t[idx]):
+            return (None, np.inf)
+        return (self.lines[idx], float(t[idx]))
+
+    def get_closest_lines(self, coords):
+        coords = np.asarray(coords, dtype=get_dtype()).reshape(-1, 2)
+        if self._index is not None:
+            pi, ei = self._get_pairs(coords)
+            distances = self._lines.get_distances(coords[pi], ei)
+            result = np.full(len(coords), np.inf, dtype=distances.dtype)
+            np.minimum.at(result, pi, distances)
+            closest = distances == result[pi]
+            idx = np.full(len(coords), len(self._lines), dtype=np.int64)
+            np.minimum.at(idx, pi[closest], ei[closest])
+            idx[np.isinf(result)] = -1
+            return (idx, result)
+
+        lines = self._lines
+        if len(lines) == 0:
+            return (np.full(len(coords), -1, dtype=np.int64),
+                    np.full(len(coords), np.inf, dtype=get_dtype()))
+        distances = np.where(lines.contains(coords),
+                             lines.get_distances(coords), np.inf)
+        idx = np.argmin(distances, axis=1)
+        distances = distances[np.arange(len(coords)), idx]
+        idx[np.isinf(distances)] = -1
+        return (idx, distances)
+
+    def get_closest_line(self, coord):
+        idx, distances = self.get_closest_lines(coord)
+        if idx[0] < 0:
+            return (None, np.inf)
+        return (self.lines[idx[0]], distances[0])
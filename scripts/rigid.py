@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+import math
+import numpy as np
+
+from move import AttenuateMove
+from objects import Object
+from precision import get_dtype
+
+
+def _cross(a, b):
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def _perp(a):
+    return np.stack((-a[..., 1], a[..., 0]), axis=-1)
+
+
+def _get_edge_normals(vertices):
+    edges = np.roll(vertices, -1, axis=0) - vertices
+    normals = np.stack((edges[:, 1], -edges[:, 0]), axis=1)
+    return normals / np.sqrt(np.sum(normals ** 2, axis=1))[:, np.newaxis]
+
+
+def _set_velocity(move, velocity):
+    if isinstance(move, AttenuateMove):
+        move.set_velocity(velocity, use_elasticity=False)
+    else:
+        move.set_velocity(velocity)
+
+
+def polygon_segments_sat(vertices, p, q, normals):
+    '''
+        Separating axis test of one convex polygon against S segments.
+        Returns (hit, depth, axis, contact) for each segment, where axis
+        points from the segment towards the polygon.
+    '''
+    center = vertices.mean(axis=0)
+    axes = _get_edge_normals(vertices)
+
+    proj = vertices @ axes.T
+    pmin, pmax = proj.min(axis=0), proj.max(axis=0)
+    sp, sq = p @ axes.T, q @ axes.T
+    smin, smax = np.minimum(sp, sq), np.maximum(sp, sq)
+    poly_overlap = np.minimum(pmax, smax) - np.maximum(pmin, smin)
+
+    mid = 0.5 * (p + q)
+    side = np.where(np.sum((center - mid) * normals, axis=1) < 0, -1.0, 1.0)
+    normals = normals * side[:, np.newaxis]
+    seg_overlap = np.sum(p * normals, axis=1) - \
+        (vertices @ normals.T).min(axis=0)
+
+    overlap = np.concatenate((poly_overlap, seg_overlap[:, np.newaxis]),
+                             axis=1)
+    hit = np.all(overlap > 0, axis=1)
+    best = np.argmin(overlap, axis=1)
+    depth = overlap[np.arange(len(p)), best]
+
+    from_poly = best < len(axes)
+    axis = np.where(from_poly[:, np.newaxis],
+                    axes[np.minimum(best, len(axes) - 1)], normals)
+    sign = np.where(np.sum((center - mid) * axis, axis=1) < 0, -1.0, 1.0)
+    axis = axis * sign[:, np.newaxis]
+
+    deepest_vertex = vertices[np.argmin(vertices @ axis.T, axis=0)]
+    deeper_end = np.where((np.sum(p * axis, axis=1) >
+                           np.sum(q * axis, axis=1))[:, np.newaxis], p, q)
+    contact = np.where(from_poly[:, np.newaxis], deeper_end, deepest_vertex)
+    return (hit, depth, axis, contact)
+
+
+def polygon_circles_sat(vertices, centers, r):
+    '''
+        Separating axis test of one convex polygon against B circles.
+        Returns (hit, depth, axis, contact) for each circle, where axis
+        points from the polygon towards the circle.
+    '''
+    axes = _get_edge_normals(vertices)
+    proj = vertices @ axes.T
+    pmin, pmax = proj.min(axis=0), proj.max(axis=0)
+    c = centers @ axes.T
+    poly_overlap = np.minimum(pmax, c + r[:, np.newaxis]) - \
+        np.maximum(pmin, c - r[:, np.newaxis])
+
+    d = centers[:, np.newaxis, :] - vertices[np.newaxis, :, :]
+    closest = np.argmin(np.sum(d * d, axis=2), axis=1)
+    vaxis = d[np.arange(len(centers)), closest]
+    vaxis = vaxis / np.maximum(np.sqrt(np.sum(vaxis ** 2, axis=1)),
+                               1e-12)[:, np.newaxis]
+    proj = np.einsum('kd,bd->bk', vertices, vaxis)
+    c = np.sum(centers * vaxis, axis=1)
+    vertex_overlap = np.minimum(proj.max(axis=1), c + r) - \
+        np.maximum(proj.min(axis=1), c - r)
+
+    overlap = np.concatenate((poly_overlap, vertex_overlap[:, np.newaxis]),
+                             axis=1)
+    hit = np.all(overlap > 0, axis=1)
+    best = np.argmin(overlap, axis=1)
+    depth = overlap[np.arange(len(centers)), best]
+    axis = np.where((best < len(axes))[:, np.newaxis],
+                    axes[np.minimum(best, len(axes) - 1)], vaxis)
+    center = vertices.mean(axis=0)
+    sign = np.where(np.sum((centers - center) * axis, axis=1) < 0, -1.0, 1.0)
+    axis = axis * sign[:, np.newaxis]
+    contact = centers - axis * r[:, np.newaxis]
+    return (hit, depth, axis, contact)
+
+
+class RigidWorld(Object):
+    def __init__(self, region=None, gravity=[0, 0]):
+        self._region = region
+        self.gravity = np.asarray(gravity, dtype=get_dtype())
+        self._shapes = list()
+        self._coord = np.zeros((0, 2), dtype=get_dtype())
+        self._velocity = np.zeros((0, 2), dtype=get_dtype())
+        self.angle = np.zeros(0, dtype=get_dtype())
+        self.omega = np.zeros(0, dtype=get_dtype())
+        self._mass = np.zeros(0, dtype=get_dtype())
+        self._inertia = np.zeros(0, dtype=get_dtype())
+        self._restitution = np.zeros(0, dtype=get_dtype())
+        self._balls = list()
+
+        if region is not None and len(region.apexes) > 1:
+            apexes = np.asarray(region.apexes, dtype=get_dtype())
+            self._p, self._q = apexes, np.roll(apexes, -1, axis=0)
+            self._normals = region._lines.normals.astype(get_dtype())
+        else:
+            empty = np.zeros((0, 2), dtype=get_dtype())
+            self._p = self._q = self._normals = empty
+
+    def add_polygon(self, apexes, velocity=[0, 0], omega=0.0, mass=1.0,
+                    restitution=1.0):
+        apexes = np.asarray(apexes, dtype=get_dtype())
+        center = apexes.mean(axis=0)
+        local = apexes - center
+        self._shapes.append(local)
+        self._coord = np.vstack((self._coord, center))
+        self._velocity = np.vstack((self._velocity,
+                                    np.asarray(velocity, dtype=get_dtype())))
+        self.angle = np.append(self.angle, 0.0)
+        self.omega = np.append(self.omega, omega)
+        self._mass = np.append(self._mass, mass)
+        inertia = mass * np.mean(np.sum(local ** 2, axis=1))
+        self._inertia = np.append(self._inertia, inertia)
+        self._restitution = np.append(self._restitution, restitution)
+        return len(self._shapes) - 1
+
+    def add_ball(self, ball, mass=1.0):
+        self._balls.append((ball, mass))
+
+    def __len__(self):
+        return len(self._shapes)
+
+    def get_vertices(self, idx):
+        c, s = math.cos(self.angle[idx]), math.sin(self.angle[idx])
+        rotation = np.asarray([[c, -s], [s, c]], dtype=get_dtype())
+        return self._shapes[idx] @ rotation.T + self._coord[idx]
+
+    def _apply_impulse(self, idx, contact, axis, j):
+        r = contact - self._coord[idx]
+        self._velocity[idx] += j * axis / self._mass[idx]
+        self.omega[idx] += _cross(r, axis) * j / self._inertia[idx]
+
+    def _get_point_velocity(self, idx, contact):
+        r = contact - self._coord[idx]
+        return self._velocity[idx] + self.omega[idx] * _perp(r)
+
+    def _collide_walls(self, idx):
+        vertices = self.get_vertices(idx)
+        lo, hi = vertices.min(axis=0), vertices.max(axis=0)
+        near = np.all((np.minimum(self._p, self._q) <= hi) &
+                      (np.maximum(self._p, self._q) >= lo), axis=1)
+        if not np.any(near):
+            return
+        hit, depth, axis, contact = polygon_segments_sat(
+            vertices, self._p[near], self._q[near], self._normals[near])
+        for k in np.flatnonzero(hit):
+            vn = self._get_point_velocity(idx, contact[k]) @ axis[k]
+            if vn < 0:
+                rn = _cross(contact[k] - self._coord[idx], axis[k])
+                j = -(1 + self._restitution[idx]) * vn / \
+                    (1 / self._mass[idx] + rn ** 2 / self._inertia[idx])
+                self._apply_impulse(idx, contact[k], axis[k], j)
+            self._coord[idx] += depth[k] * axis[k]
+
+    def _collide_balls(self, idx):
+        balls = [ball for ball, _ in self._balls]
+        mass = np.asarray([m for _, m in self._balls])
+        centers = np.asarray([ball.get_coord() for ball in balls],
+                             dtype=get_dtype())
+        r = np.asarray([ball.r for ball in balls], dtype=get_dtype())
+        hit, depth, axis, contact = polygon_circles_sat(
+            self.get_vertices(idx), centers, r)
+        for k in np.flatnonzero(hit):
+            move = balls[k]._move
+            elasticity = getattr(move, '_elasticity', 1.0)
+            e = self._restitution[idx] * elasticity
+            vb = move.get_velocity()
+            vn = (vb - self._get_point_velocity(idx, contact[k])) @ axis[k]
+            if vn < 0:
+                rn = _cross(contact[k] - self._coord[idx], axis[k])
+                j = -(1 + e) * vn / (1 / mass[k] + 1 / self._mass[idx] +
+                                     rn ** 2 / self._inertia[idx])
+                self._apply_impulse(idx, contact[k], axis[k], -j)
+                vb = vb + j * axis[k] / mass[k]
+                _set_velocity(move, vb)
+
+            share = self._mass[idx] / (self._mass[idx] + mass[k])
+            self._coord[idx] -= depth[k] * (1 - share) * axis[k]
+            coord = centers[k] + depth[k] * share * axis[k]
+            move.set_coord(coord)
+            balls[k]._on_collision(coord, move.get_velocity())
+
+    def step(self, dt):
+        self._velocity += self.gravity * dt
+        self._coord += self._velocity * dt
+        self.angle += self.omega * dt
+        for idx in range(len(self._shapes)):
+            if len(self._p) > 0:
+                self._collide_walls(idx)
+            if len(self._balls) > 0:
+                self._collide_balls(idx)
+
+    def __call__(self, dt):
+        self.step(dt)
+        outlines = list()
+        gap = np.full((1, 2), np.nan, dtype=get_dtype())
+        for idx in range(len(self._shapes)):
+            vertices = self.get_vertices(idx)
+            outlines.extend((vertices, vertices[:1], gap))
+        if len(outlines) == 0:
+            return (gap[0, :0], gap[0, :0])
+        outline = np.concatenate(outlines).T
+        return (outline[0], outline[1])
@@ -7,8 +7,9 @@ import numpy as np
 from drawer import WindowDrawer, MP4Drawer
 from region import Region, Domain, get_line_from_coords
 from move import TraceMove, Move
-from trace import ParabolaTrace, BasicTrace
+from trace import BasicTrace, get_parabola_sequence, find_crossings
 from trigger import ToggleTrigger
+from objects import Circle
 
 
 class ScenePalabolaTrace(BasicTrace):
@@ -30,29 +31,25 @@ class ScenePalabolaTrace(BasicTrace):
         t = self._directions[self._dir_idx]
         velocity = np.asarray((np.cos(t), np.sin(t)), dtype=np.float32)
         velocity = velocity * self._speed
-        parabola = ParabolaTrace(coord, velocity, height=self._height,
-                                 **self._kwargs)
-
-        x = np.asarray([parabola() for i in range(1000)])
-        mind = np.inf
+        x = get_parabola_sequence(coord, velocity, height=self._height,
+                                  n=1000, **self._kwargs)
+
+        dx = np.diff(x[:, 0])
+        reflect = np.flatnonzero(dx[1:] * dx[:-1] < 0) + 2
+        end = reflect[1] if len(reflect) >= 2 else len(x) - 1
+        down, up = find_crossings(x[:end + 1, 1], self._height)
+        down, up = down[down >= 2], up[up >= 2]
+
+        idx = np.concatenate((down, up))
+        targets = np.concatenate((down, up - 1))
+        d = np.abs(x[targets, 0] - coord[0])
+        xr = x[idx, 0]
+        valid = (self._target_range[0] <= xr) & (xr <= self._target_range[1])
+        order = np.argsort(idx[valid], kind='stable')
+        targets, d = targets[valid][order], d[valid][order]
         target = -1
-        n_reflect = 0
-        for i in range(2, len(x)):
-            if x[i][1] < self._height and x[i - 1][1] > self._height:
-                d = abs(x[i][0] - coord[0])
-                if d <= mind and x[i][0] in target_range:
-                    target = i
-                    mind = d
-            elif x[i][1] > self._height and x[i - 1][1] < self._height:
-                d = abs(x[i - 1][0] - coord[0])
-                if d <= mind and x[i][0] in target_range:
-                    target = i - 1
-                    mind = d
-
-            if (x[i][0] - x[i - 1][0]) * (x[i - 1][0] - x[i - 2][0]) < 0:
-                n_reflect += 1
-            if n_reflect >= 2:
-                break
+        if len(d) > 0:
+            target = targets[len(d) - 1 - np.argmin(d[::-1])]
         self.coords = x[:target + 1]
         self._dir_idx = (self._dir_idx + 1) % len(self._directions)
 
@@ -102,21 +99,6 @@ class ChaseParabolaTrace(BasicTrace):
         return coord
 
 
-class Circle(object):
-    def __init__(self, move, r, samples=100):
-        self._move = move
-        self.r = r
-        self.samples = samples
-
-    def __call__(self, dt):
-        coord = self._move(dt)
-        t = np.asarray(range(self.samples), dtype=np.float32)
-        t = t * 2 * math.pi / (self.samples - 1)
-        xs = np.cos(t) * self.r + coord[0]
-        ys = np.sin(t) * self.r + coord[1]
-        return (xs, ys)
-
-
 class Polynomics(object):
     def __init__(self, move, dx):
         self._move = move
@@ -153,7 +135,8 @@ if __name__ == '__main__':
     drawer = MP4Drawer(filename=name, xlim=[-0.1, 4.0], ylim=[-0.1, 3.0],
                        dt=dt)
 
-    btrace = ScenePalabolaTrace([x0, h], v, d, h, dh, lim=lim)
+    btrace = ScenePalabolaTrace([x0, h], v, d, h, dh, lim=lim,
+                                target_range=target_range)
     # btrace = ScenePalabolaTrace([x0, h], v, d, h, dh, lim=lim, dt=dt)
     ntrace = ChaseParabolaTrace(btrace)
     bmove = TraceMove(btrace)
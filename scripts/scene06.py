@@ -7,21 +7,7 @@ import numpy as np
 from drawer import WindowDrawer, MP4Drawer
 from move import TraceMove, Move
 from trace import BasicTrace, ParabolaTrace
-
-
-class Circle(object):
-    def __init__(self, move, r, samples=100):
-        self._move = move
-        self.r = r
-        self.samples = samples
-
-    def __call__(self, dt):
-        coord = self._move(dt)
-        t = np.asarray(range(self.samples), dtype=np.float32)
-        t = t * 2 * math.pi / (self.samples - 1)
-        xs = np.cos(t) * self.r + coord[0]
-        ys = np.sin(t) * self.r + coord[1]
-        return (xs, ys)
+from objects import Circle
 
 
 class Polynomics(object):
@@ -7,6 +7,7 @@ import numpy as np
 from drawer import WindowDrawer, MP4Drawer
 from move import TraceMove
 from trace import BasicTrace, ParabolaTrace
+from objects import Circle
 
 
 class Polynomics(object):
@@ -22,21 +23,6 @@ class Polynomics(object):
         return (xs, ys)
 
 
-class Circle(object):
-    def __init__(self, move, r, samples=100):
-        self._move = move
-        self.r = r
-        self.samples = samples
-
-    def __call__(self, dt):
-        coord = self._move(dt)
-        t = np.asarray(range(self.samples), dtype=np.float32)
-        t = t * 2 * math.pi / (self.samples - 1)
-        xs = np.cos(t) * self.r + coord[0]
-        ys = np.sin(t) * self.r + coord[1]
-        return (xs, ys)
-
-
 if __name__ == '__main__':
     r = 0.1
     l = 0.3
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+from region import Region
+from move import StandardMove, TriggeredMove
+from objects import Ball
+from trigger import (TriggerScheduler, TriggerGraph, SumEventTrigger,
+                     ProductEventTrigger, FunctionalTrigger, NullTrigger,
+                     ToggleTrigger)
+
+
+class _Counter(object):
+    def __init__(self):
+        self.count = 0
+
+    def call(self, **kwargs):
+        self.count += 1
+
+
+def _run_event(ball_first, frames=200, dt=0.02):
+    region = Region([[-1, -1], [-1, 1], [1, 1], [1, -1]])
+    ball = Ball(StandardMove([0.0, 0.5], [0.7, 0.0], [0, -3.0]), region, 0.1)
+    scheduler = TriggerScheduler()
+    event = scheduler.add_event()
+    collisions = _Counter()
+    ball.add_collision_trigger(event)
+    ball.add_collision_trigger(collisions)
+
+    fired = list()
+    move = TriggeredMove([0, 0])
+    move.add_action_trigger(event, lambda: fired.append(scheduler.frame))
+    for frame in range(frames):
+        scheduler(dt)
+        if ball_first:
+            ball(dt)
+            move(dt)
+        else:
+            move(dt)
+            ball(dt)
+    return (collisions.count, fired)
+
+
+def test_event_fires_once_per_call():
+    for ball_first in (True, False):
+        count, fired = _run_event(ball_first)
+        assert count > 1
+        assert len(fired) == count
+        assert len(set(fired)) == count
+
+
+def test_graph_short_circuits_and_sees_new_children():
+    calls = list()
+    graph = TriggerGraph()
+    any_trig = SumEventTrigger()
+    any_trig.add_trigger(NullTrigger(True))
+    any_trig.add_trigger(FunctionalTrigger(lambda: calls.append(1) or True))
+    gate = ToggleTrigger(False)
+    all_trig = ProductEventTrigger()
+    all_trig.add_trigger(gate)
+    all_trig.add_trigger(FunctionalTrigger(lambda: calls.append(2) or True))
+    compiled_any = graph.add_trigger(any_trig)
+    compiled_all = graph.add_trigger(all_trig)
+    graph(0.02)
+    assert compiled_any and not compiled_all
+    assert calls == []
+
+    gate(True)
+    graph(0.02)
+    assert compiled_all
+    all_trig.add_trigger(NullTrigger(False))
+    graph(0.02)
+    assert not compiled_all
+    assert calls == [2, 2]
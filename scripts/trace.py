@@ -1,10 +1,35 @@
 # -*- coding: utf-8 -*-
 
 import math
+from functools import lru_cache
 import numpy as np
 import matplotlib.pyplot as plt
 
 
+def fold_into_range(xs, lim):
+    '''
+        unfolded: lo------hi------lo------hi
+        folded  : lo/\/\/\/\/\/\/\/\/\/hi
+    '''
+    lo, hi = lim
+    if np.isinf(lo) and np.isinf(hi):
+        return (xs.copy(), 0)
+    if np.isinf(lo) or np.isinf(hi):
+        wall, sign = (lo, 1) if np.isinf(hi) else (hi, -1)
+        folded = wall + sign * np.abs(xs - wall)
+        outside = (sign * (xs - wall) < 0).astype(np.int64)
+        n_reflect = int(np.abs(np.diff(outside, prepend=0)).sum())
+        return (folded.astype(xs.dtype), n_reflect)
+
+    width = hi - lo
+    u = np.mod(xs - lo, 2 * width)
+    folded = lo + width - np.abs(u - width)
+
+    cells = np.floor((xs - lo) / width)
+    n_reflect = int(np.abs(np.diff(cells, prepend=0)).sum())
+    return (folded.astype(xs.dtype), n_reflect)
+
+
 class BasicTrace(object):
     def __init__(self, coords, repeat=True):
         self.coords = np.asarray(coords, dtype=np.float32)
@@ -61,28 +86,35 @@ class ParabolaTrace(BasicTrace):
         ys = -p1 * ((xs - x0[0]) ** 2) + 2 * p1 * p2 * (xs - x0[0]) + x0[1]
         xs[-1], ys[-1] = (x1[0], x1[1])
 
-        for i in range(len(xs)):
-            if xs[i] < self._range[0]:
-                xs[i:] = self._range[0] * 2 - xs[i:]
-                v[0] = -v[0] * self._elasticity
-            elif xs[i] > self._range[1]:
-                xs[i:] = self._range[1] * 2 - xs[i:]
-                v[0] = -v[0] * self._elasticity
+        xs, n_reflect = fold_into_range(xs, self._range)
+        v[0] = v[0] * (-self._elasticity) ** n_reflect
         v[1] = np.sqrt(v[1] ** 2 + 2 * a * height)
 
         self._velocity = v
         self.coords = np.asarray((xs, ys), dtype=np.float32)
 
+    def _bounce(self, coord):
+        self._init_coord = coord
+        self._velocity[1] = self._velocity[1] * self._elasticity
+        self._compute_parabola()
+        self._idx = 0
+
     def __call__(self):
         coord = self.coords[:, self._idx]
         self._idx += 1
         if self._idx >= self.coords.shape[1]:
-            self._init_coord = coord
-            self._velocity[1] = self._velocity[1] * self._elasticity
-            self._compute_parabola()
-            self._idx = 0
+            self._bounce(coord)
         return coord
 
+    def next_arc(self):
+        '''
+            the samples __call__ would return up to and including the
+            next bounce, as a (k, 2) array
+        '''
+        arc = self.coords[:, self._idx:].T
+        self._bounce(self.coords[:, -1])
+        return arc
+
     def copy(self):
         trace = ParabolaTrace(self._init_coord.copy(), self._velocity.copy(),
                               self._grabity, self._elasticity, self.dt,
@@ -90,3 +122,34 @@ class ParabolaTrace(BasicTrace):
         trace.coords = self.coords.copy()
         trace._idx = self._idx
         return trace
+
+
+@lru_cache(maxsize=256)
+def _parabola_sequence(coord, velocity, height, grabity, elasticity, dt, lim,
+                       n):
+    trace = ParabolaTrace(coord, velocity, height, grabity, elasticity, dt,
+                          lim)
+    arcs = list()
+    total = 0
+    while total < n:
+        arcs.append(trace.next_arc())
+        total += arcs[-1].shape[0]
+    coords = np.concatenate(arcs)[:n]
+    coords.flags.writeable = False
+    return coords
+
+
+def get_parabola_sequence(coord, velocity, height=0.0, grabity=0.3,
+                          elasticity=0.9, dt=0.05, lim=[0.0, 1.0], n=1000):
+    coord = tuple(np.asarray(coord, dtype=np.float32).tolist())
+    velocity = tuple(np.asarray(velocity, dtype=np.float32).tolist())
+    lim = tuple(np.asarray(lim, dtype=np.float32).tolist())
+    return _parabola_sequence(coord, velocity, float(height), float(grabity),
+                              float(elasticity), float(dt), lim, n)
+
+
+def find_crossings(ys, height):
+    below, above = ys < height, ys > height
+    down = np.flatnonzero(below[1:] & above[:-1]) + 1
+    up = np.flatnonzero(above[1:] & below[:-1]) + 1
+    return (down, up)
@@ -1,12 +1,19 @@
 # -*- coding: utf-8 -*-
 
+import time
+import heapq
 from abc import ABCMeta, abstractmethod
+import numpy as np
+
 
 class BaseTrigger(object):
     @abstractmethod
     def __bool__(self):
         return False
 
+    def evaluate(self, resolve):
+        return bool(self)
+
 
 class ToggleTrigger(BaseTrigger):
     def __init__(self, default=False):
@@ -32,7 +39,7 @@ class RegionTrigger(BaseTrigger):
 
     def __bool__(self):
         coord = self._move.get_coord()
-        return coord in self._region
+        return bool(self._region.contains(coord)[0])
 
 
 class DomainTrigger(BaseTrigger):
@@ -64,6 +71,53 @@ class DomainTrigger(BaseTrigger):
         return is_range and self._state
 
 
+def _get_coords(source):
+    if hasattr(source, 'get_coords'):
+        return np.asarray(source.get_coords()).reshape(-1, 2)
+    return np.asarray(source()).reshape(-1, 2)
+
+
+class BatchRegionTrigger(BaseTrigger):
+    def __init__(self, source, region):
+        self._source = source
+        self._region = region
+
+    def mask(self):
+        return self._region.contains(_get_coords(self._source))
+
+    def __bool__(self):
+        return bool(np.any(self.mask()))
+
+
+class BatchDomainTrigger(BaseTrigger):
+    def __init__(self, source, domain, mode='both'):
+        self._source = source
+        self._prev = _get_coords(source)[:, 0]
+        self._domain = domain
+        self._mode = mode
+        self._state = np.full(len(self._prev), mode not in ('left', 'right'))
+        self._state |= self._is_range(self._prev)
+
+    def _is_range(self, xs):
+        return (self._domain[0] <= xs) & (xs <= self._domain[1])
+
+    def mask(self):
+        xs = _get_coords(self._source)[:, 0]
+        prev = self._prev
+        self._prev = xs
+        is_range = self._is_range(xs)
+        if self._mode == 'left':
+            self._state = np.where(prev < self._domain[0], is_range,
+                                   self._state)
+        elif self._mode == 'right':
+            self._state = np.where(self._domain[1] < prev, is_range,
+                                   self._state & is_range)
+        return is_range & self._state
+
+    def __bool__(self):
+        return bool(np.any(self.mask()))
+
+
 class FunctionalTrigger(BaseTrigger):
     def __init__(self, func):
         self._func = func
@@ -85,6 +139,9 @@ class SumEventTrigger(BaseTrigger):
                 return True
         return False
 
+    def evaluate(self, resolve):
+        return any(resolve(trig) for trig in self._triggers)
+
 
 class ProductEventTrigger(BaseTrigger):
     def __init__(self):
@@ -99,6 +156,9 @@ class ProductEventTrigger(BaseTrigger):
                 return False
         return True
 
+    def evaluate(self, resolve):
+        return all(resolve(trig) for trig in self._triggers)
+
 
 class SceneTrigger(BaseTrigger):
     def __init__(self):
@@ -109,13 +169,18 @@ class SceneTrigger(BaseTrigger):
     def add_trigger(self, trig):
         self._triggers.append(trig)
 
-    def __bool__(self):
-        trig = bool(self._triggers[self._idx])
+    def _update(self, trig):
         if self._prev and not trig:
             self._idx = (self._idx + 1) % len(self._triggers)
         self._prev = trig
         return trig
 
+    def __bool__(self):
+        return self._update(bool(self._triggers[self._idx]))
+
+    def evaluate(self, resolve):
+        return self._update(resolve(self._triggers[self._idx]))
+
 
 class NullTrigger(BaseTrigger):
     def __init__(self, state=True):
@@ -123,3 +188,190 @@ class NullTrigger(BaseTrigger):
 
     def __bool__(self):
         return self._state
+
+
+class CompiledTrigger(BaseTrigger):
+    def __init__(self, graph, trig):
+        self._graph = graph
+        self._trig = trig
+
+    def __bool__(self):
+        return self._graph.get_value(self._trig)
+
+
+class TriggerGraph(object):
+    def __init__(self):
+        self._roots = list()
+        self._values = None
+        self._stats = dict()
+        self._nested = 0.0
+
+    def add_trigger(self, trig):
+        self._roots.append(trig)
+        return CompiledTrigger(self, trig)
+
+    def _resolve(self, trig):
+        key = id(trig)
+        if key not in self._values:
+            outer = self._nested
+            self._nested = 0.0
+            start = time.perf_counter()
+            self._values[key] = bool(trig.evaluate(self._resolve))
+            elapsed = time.perf_counter() - start
+            stat = self._stats.setdefault(key, [trig, 0, 0.0])
+            stat[1] += 1
+            stat[2] += elapsed - self._nested
+            self._nested = outer + elapsed
+        return self._values[key]
+
+    def evaluate(self):
+        self._values = dict()
+        for trig in self._roots:
+            self._resolve(trig)
+
+    def __call__(self, dt):
+        self.evaluate()
+
+    def get_value(self, trig):
+        if self._values is None:
+            self.evaluate()
+        return self._resolve(trig)
+
+    def get_stats(self):
+        return [tuple(stat) for stat in self._stats.values()]
+
+
+def _get_travel_time(distance, speed, accel):
+    if accel > 0:
+        return (-speed + np.sqrt(speed ** 2 + 2 * accel * distance)) / accel
+    if speed > 0:
+        return distance / speed
+    return np.inf
+
+
+def _get_motion_bound(move):
+    if not hasattr(move, 'get_velocity'):
+        return None
+    # bounces off slanted walls turn speed along one axis into the other,
+    # so only the norms bound how fast a coordinate can change
+    v = move.get_velocity()
+    a = move.get_accel() if hasattr(move, 'get_accel') else np.zeros(2)
+    return (np.sqrt(v @ v), np.sqrt(a @ a))
+
+
+def predict_domain_crossing(move, domain):
+    def predict(dt):
+        bound = _get_motion_bound(move)
+        if bound is None:
+            return 0.0
+        x = move.get_coord()[0]
+        distance = np.min(np.abs(np.asarray(domain[:]) - x))
+        return _get_travel_time(distance, *bound)
+    return predict
+
+
+def predict_region_crossing(move, region):
+    def predict(dt):
+        bound = _get_motion_bound(move)
+        if bound is None or len(region._lines) == 0:
+            return 0.0
+        coord = np.asarray(move.get_coord())
+        distance = np.min(np.abs(region._lines.func(coord[np.newaxis])))
+        return _get_travel_time(distance, *bound)
+    return predict
+
+
+class ScheduledTrigger(BaseTrigger):
+    def __init__(self, scheduler, trig, predict):
+        self._scheduler = scheduler
+        self._trig = trig
+        self._predict = predict
+        self._value = False
+        self._version = 0
+
+    def poll(self, dt):
+        self._value = bool(self._trig)
+        return self._predict(dt)
+
+    def __bool__(self):
+        return self._value
+
+
+class EventTrigger(BaseTrigger):
+    def __init__(self, scheduler):
+        self._scheduler = scheduler
+        self._frame = None
+        self._pending = False
+        self.kwargs = dict()
+
+    def call(self, **kwargs):
+        self._frame = self._scheduler.frame
+        self._pending = True
+        self.kwargs = kwargs
+
+    def __bool__(self):
+        # consumed when read, so each call() fires exactly once whichever
+        # of the caller and the reader is stepped first
+        pending, self._pending = self._pending, False
+        return pending
+
+
+class TriggerScheduler(object):
+    def __init__(self):
+        self._queue = list()
+        self._seq = 0
+        self.time = 0.0
+        self.frame = 0
+        self.dt = 0.0
+
+    def _push(self, scheduled, delay):
+        if not np.isfinite(delay):
+            return
+        scheduled._version += 1
+        self._seq += 1
+        heapq.heappush(self._queue, (self.time + max(delay, 0.0), self._seq,
+                                     scheduled._version, scheduled))
+
+    def add(self, trig, predict=None):
+        if predict is None and isinstance(trig, DomainTrigger):
+            predict = predict_domain_crossing(trig._move, trig._domain)
+        elif predict is None and isinstance(trig, RegionTrigger):
+            predict = predict_region_crossing(trig._move, trig._region)
+        elif predict is None:
+            predict = lambda dt: 0.0
+        scheduled = ScheduledTrigger(self, trig, predict)
+        self._push(scheduled, scheduled.poll(self.dt))
+        return scheduled
+
+    def add_event(self):
+        return EventTrigger(self)
+
+    def at_time(self, start, end=np.inf):
+        def predict(dt):
+            upcoming = [t for t in (start, end) if t > self.time]
+            return min(upcoming) - self.time if upcoming else np.inf
+        trig = FunctionalTrigger(lambda: start <= self.time < end)
+        return self.add(trig, predict)
+
+    def at_frame(self, start, end=np.inf):
+        def predict(dt):
+            upcoming = [f for f in (start, end) if f > self.frame]
+            if not upcoming:
+                return np.inf
+            return (min(upcoming) - self.frame) * dt
+        trig = FunctionalTrigger(lambda: start <= self.frame < end)
+        return self.add(trig, predict)
+
+    def wake(self, scheduled):
+        self._push(scheduled, 0.0)
+
+    def __call__(self, dt):
+        self.dt = dt
+        eps = dt * 1e-6
+        while self._queue and self._queue[0][0] <= self.time + eps:
+            _, _, version, scheduled = heapq.heappop(self._queue)
+            if version != scheduled._version:
+                continue
+            self._push(scheduled, max(scheduled.poll(dt), dt))
+        self.time += dt
+        self.frame += 1